@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import sys
+import os
+import argparse
+import logging
+import json
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+
+import VAT_http
+import VAT_interface
+import VAT_jobqueue
+import VAT_manifest
+import VAT_metrics
+import VAT_tileindex
+
+
+def runTarget(vati, specsFile, mosaic=False, processes=None):
+    """
+    enchaîne, sans interface graphique, la vérification du nom, le calcul des tuiles
+    et l'import des fits d'un fichier de spécifications écrit par VATGui.jsonDump.
+    Avec mosaic, les tuiles sont ensuite assemblées en une image par canal.
+    Retourne la liste des échecs, None si l'objet est inconnu
+    """
+    logging.info("runTarget %s"%specsFile)
+    with open(specsFile, encoding="utf-8") as f:
+        specs = json.load(f)
+    # --- sans dossier choisi dans l'interface, les fits sont écrits à côté du fichier de spécifications
+    if len(specs.get("targetSpecsFile", "")) == 0:
+        specs["targetSpecsFile"] = os.path.abspath(specsFile)
+    objName = specs["le_target"]
+    if not vati.checkObjName(objName):
+        logging.error("%s: unknown object %s"%(specsFile, objName))
+        return None
+    nbTiles, tileFov, cover = vati.calculateNbTiles(specs["dsb_visionField"],
+                                                    specs["dsb_percentCoverage"],
+                                                    specs["dsb_resolution"],
+                                                    specs["sb_nbPixels"])
+    tileCoordinatesCenters = vati.tilesCoordinates(objName, nbTiles, tileFov, specs["dsb_percentCoverage"])
+    failures = vati.importFits(json.dumps(specs), tileCoordinatesCenters, tileFov)
+    if mosaic:
+        vati.mosaicFits(json.dumps(specs), nbTiles, cover, processes)
+    return failures
+
+
+def runJob(vati, queue, specsFile, mosaic=False, processes=None):
+    try:
+        failures = runTarget(vati, specsFile, mosaic, processes)
+    except Exception as e:
+        logging.exception("%s: import aborted"%specsFile)
+        queue.finish(specsFile, str(e))
+        return
+    if failures is None:
+        queue.finish(specsFile, "unknown object")
+    elif len(failures) > 0:
+        queue.finish(specsFile, "%d tiles failed"%len(failures))
+    else:
+        queue.finish(specsFile)
+
+
+def drainQueue(vati, queue, maxTargets, mosaic=False, processes=None):
+    """
+    importer les cibles de la file par ordre de priorité, maxTargets à la fois.
+    Toutes les cibles partagent le pool de téléchargement de vati:
+    le parallélisme entre cibles n'augmente pas la charge sur SkyView
+    """
+    with ThreadPoolExecutor(max_workers=maxTargets, thread_name_prefix="VAT_target") as targets:
+        running = set()
+        while True:
+            while len(running) < maxTargets:
+                specsFile = queue.next()
+                if specsFile is None:
+                    break
+                running.add(targets.submit(runJob, vati, queue, specsFile, mosaic, processes))
+            if len(running) == 0:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+    logging.info("queue drained: %s"%queue.counts())
+
+
+def writeMetrics(metrics, prometheusFile=None):
+    metrics.logSummary()
+    metrics.writeSummary()
+    metrics.close()
+    if prometheusFile is not None:
+        metrics.writePrometheus(prometheusFile)
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="VAT batch: import the fits tiles of target specifications files without GUI")
+    parser.add_argument("specsFiles", nargs="*", help="target specifications json files, as saved by mainGui")
+    parser.add_argument("--queue", default=None, help="persistent job queue file: the specs files are added to it, then the whole queue is imported")
+    parser.add_argument("--priority", type=int, default=0, help="priority of the specs files added to the queue (default: %(default)s)")
+    parser.add_argument("--targets", type=int, default=2, help="number of queued targets imported at the same time (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=4, help="number of parallel downloads (default: %(default)s)")
+    parser.add_argument("--pool-size", type=int, default=None, help="persistent connections kept per server, shared by all requests (default: twice --workers)")
+    parser.add_argument("--timeout", type=float, default=None, help="read timeout of the http requests, in seconds (default: %d)"%VAT_http.READ_TIMEOUT)
+    parser.add_argument("--rate", type=float, default=None, help="maximum requests per second and per host")
+    parser.add_argument("--attempts", type=int, default=5, help="maximum attempts per tile and channel (default: %(default)s)")
+    parser.add_argument("--refetch", type=int, default=2, help="maximum new downloads of the tiles failing the quality checks (default: %(default)s)")
+    parser.add_argument("--no-batching", action="store_true", help="request each tile separately, instead of blocks of neighbouring small tiles cut locally")
+    parser.add_argument("--reuse-tolerance", type=float, default=VAT_tileindex.TOLERANCE, help="reuse a cached tile whose center is closer than this fraction of the tile side, 0 for identical centers only (default: %(default)s)")
+    parser.add_argument("--mosaic", action="store_true", help="assemble the imported tiles into one mosaic per channel")
+    parser.add_argument("--processes", type=int, default=None, help="number of processes building a mosaic (default: one per core)")
+    parser.add_argument("--base-url", default=None, help="SkyView and Sesame compatible server replacing the real services, for example VAT_standin (default: environment variable VAT_BASE_URL)")
+    parser.add_argument("--offline", action="store_true", help="resolve object names from the local cache only")
+    parser.add_argument("--metrics", default=None, help="append the timing of each stage to this JSON lines file")
+    parser.add_argument("--prometheus", default=None, help="write the metrics summary to this Prometheus text file")
+    parser.add_argument("--log", default="INFO", help="logging level (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.queue is None and len(args.specsFiles) == 0:
+        parser.error("give specs files or a --queue file")
+    return args
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    logging.basicConfig(level=getattr(logging, args.log.upper()))
+    vati = VAT_interface.VAT_interface(args.workers, args.rate, args.attempts, offline=args.offline, maxRefetch=args.refetch,
+                                       baseUrl=args.base_url, metrics=VAT_metrics.Metrics(args.metrics),
+                                       batching=not args.no_batching, poolSize=args.pool_size, timeout=args.timeout,
+                                       reuseTolerance=args.reuse_tolerance)
+    if args.queue is not None:
+        queue = VAT_jobqueue.JobQueue(args.queue)
+        for specsFile in args.specsFiles:
+            queue.add(specsFile, args.priority)
+        drainQueue(vati, queue, args.targets, args.mosaic, args.processes)
+        vati.scheduler.shutdown()
+        writeMetrics(vati.metrics, args.prometheus)
+        return 1 if queue.counts().get(VAT_manifest.FAILED, 0) > 0 else 0
+    status = 0
+    for specsFile in args.specsFiles:
+        try:
+            failures = runTarget(vati, specsFile, args.mosaic, args.processes)
+        except Exception:
+            logging.exception("%s: import aborted"%specsFile)
+            failures = None
+        if failures is None or len(failures) > 0:
+            status = 1
+    vati.scheduler.shutdown()
+    writeMetrics(vati.metrics, args.prometheus)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
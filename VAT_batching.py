@@ -0,0 +1,144 @@
+import os
+import logging
+import threading
+
+import numpy as np
+
+import VAT_lazy
+
+fits = VAT_lazy.module("astropy.io.fits")
+wcs = VAT_lazy.module("astropy.wcs")
+nddata = VAT_lazy.module("astropy.nddata")
+VAT_fits = VAT_lazy.module("VAT_fits")
+
+# --- côté maximal, en pixels, de l'image d'un bloc demandée à SkyView
+MAX_BLOCK_PIXELS = 2048
+# --- marge en pixels autour des tuiles d'un bloc (écart entre offsets sphériques et projection TAN)
+BLOCK_MARGIN = 4
+# --- part visée de la latence d'une requête dans le temps total d'un bloc
+LATENCY_SHARE = 0.25
+# --- taux d'échec des requêtes au-delà duquel la taille des blocs est divisée par 2
+MAX_FAILURE_RATE = 0.2
+# --- poids d'une nouvelle mesure dans les moyennes glissantes
+SMOOTHING = 0.3
+
+# --- mots clés WCS du bloc, remplacés dans l'en-tête de chaque tuile
+WCS_KEYS = ("CTYPE", "CRVAL", "CRPIX", "CDELT", "CUNIT", "CROTA", "CD1_", "CD2_", "PC1_", "PC2_", "LONPOLE", "LATPOLE")
+
+
+def smooth(mean, value):
+    return value if mean is None else mean + SMOOTHING*(value - mean)
+
+
+class AdaptiveBatcher:
+    """
+    choix du nombre k de tuiles par côté des blocs demandés en une seule requête SkyView.
+    SkyView ne prend qu'une position par requête: un bloc de k x k tuiles voisines est demandé
+    comme une seule image au même échantillonnage, puis découpé en tuiles (splitBlock).
+    k augmente de 1 tant que la latence des requêtes domine le temps de transfert d'une tuile,
+    il est divisé par 2 quand le taux d'échec dépasse MAX_FAILURE_RATE.
+    k ne change qu'après une nouvelle mesure: un pas par requête terminée, pas par bloc demandé.
+    Partagé entre les threads de téléchargement
+    """
+
+    def __init__(self, maxSize=8, enabled=True):
+        self.lock = threading.Lock()
+        self.maxSize = maxSize if enabled else 1
+        self.k = 1
+        self.latency = None
+        self.tileSeconds = None
+        self.failureRate = 0.
+        self.observed = False
+
+    def observe(self, latency, seconds, nbTiles, ok=True):
+        """
+        résultat d'une requête: latence (formulaire et page de résultats), durée des transferts et découpes,
+        nombre de tuiles obtenues
+        """
+        with self.lock:
+            self.observed = True
+            self.failureRate = smooth(self.failureRate, 0. if ok else 1.)
+            if ok:
+                self.latency = smooth(self.latency, latency)
+                self.tileSeconds = smooth(self.tileSeconds, seconds/max(nbTiles, 1))
+
+    def limit(self, nbTiles, nbPixels, maxWorkers):
+        """
+        k maximal: taille d'image acceptée par SkyView, et assez de blocs pour occuper tous les threads
+        """
+        return max(1, min(self.maxSize, MAX_BLOCK_PIXELS//nbPixels, int(nbTiles/np.sqrt(maxWorkers))))
+
+    def size(self, nbTiles, nbPixels, maxWorkers):
+        """
+        k pour le prochain bloc demandé d'une grille nbTiles x nbTiles de tuiles de nbPixels,
+        d'après les requêtes déjà terminées (observe)
+        """
+        limit = self.limit(nbTiles, nbPixels, maxWorkers)
+        with self.lock:
+            previous = self.k
+            if self.observed and self.failureRate > MAX_FAILURE_RATE:
+                self.k = max(1, self.k//2)
+                self.failureRate = 0.
+            elif self.observed and self.latency is not None and self.tileSeconds > 0.:
+                # --- latence <= LATENCY_SHARE du temps du bloc: k² >= latence*(1 - part)/(part*durée par tuile)
+                target = int(np.ceil(np.sqrt(self.latency*(1. - LATENCY_SHARE)/(LATENCY_SHARE*self.tileSeconds))))
+                self.k += int(np.sign(target - self.k))
+            self.observed = False
+            self.k = max(1, min(self.k, limit))
+            if self.k != previous:
+                logging.info("batch size %d (latency %s, per tile %s, failures %.2f)"%(self.k, self.latency, self.tileSeconds, self.failureRate))
+            return self.k
+
+
+def groupTiles(work, nbTiles, k):
+    """
+    regroupe les tuiles (i, canaux manquants) en blocs de k x k tuiles voisines
+    de la grille nbTiles x nbTiles (tuile i en colonne i // nbTiles, ligne i % nbTiles)
+    """
+    blocks = {}
+    for (i, missing) in work:
+        blocks.setdefault(((i//nbTiles)//k, (i % nbTiles)//k), []).append((i, missing))
+    return list(blocks.values())
+
+
+def blockGeometry(centers, tileFov, nbPixels):
+    """
+    centre, nombre de pixels et rayon (degrés) de l'image qui contient toutes les tuiles centrées sur centers.
+    SkyView rend une image de côté 2 x rayon: l'échantillonnage des tuiles est 2*tileFov/nbPixels
+    """
+    scale = 2.*tileFov/nbPixels
+    first = centers[0]
+    last = centers[-1]
+    center = first.directional_offset_by(first.position_angle(last), first.separation(last)/2.)
+    dlon, dlat = center.spherical_offsets_to(centers)
+    extent = 2.*max(np.max(np.abs(dlon.degree)), np.max(np.abs(dlat.degree)))
+    pixels = int(np.ceil(extent/scale)) + nbPixels + 2*BLOCK_MARGIN
+    return center, pixels, pixels*scale/2.
+
+
+def splitBlock(blockFile, tiles, nbPixels):
+    """
+    découpe l'image d'un bloc en tuiles nbPixels x nbPixels centrées sur les positions demandées.
+    tiles: liste de (centre SkyCoord, fichier). Les valeurs sont copiées sans mise à l'échelle,
+    avec les BSCALE/BZERO/BLANK du bloc; le WCS de chaque tuile est celui du bloc, décalé
+    """
+    with fits.open(blockFile, memmap=False, do_not_scale_image_data=True) as hdul:
+        hdu = VAT_fits.imageHDU(hdul)
+        if hdu is None:
+            raise IOError("no image in block %s"%blockFile)
+        blockWcs = wcs.WCS(hdu.header)
+        header = hdu.header.copy()
+        for k in list(header.keys()):
+            if k.startswith(WCS_KEYS):
+                del header[k]
+        for (center, fileName) in tiles:
+            x, y = blockWcs.world_to_pixel(center)
+            cutout = nddata.Cutout2D(hdu.data, (float(x), float(y)), (nbPixels, nbPixels), wcs=blockWcs, mode="strict")
+            tile = fits.PrimaryHDU(cutout.data, header)
+            tile.header.update(cutout.wcs.to_header())
+            for k in ("BSCALE", "BZERO", "BLANK"):
+                if k in hdu.header:
+                    tile.header[k] = hdu.header[k]
+            partName = fileName + ".part"
+            tile.writeto(partName, overwrite=True, output_verify="ignore")
+            os.replace(partName, fileName)
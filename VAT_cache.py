@@ -0,0 +1,170 @@
+import os
+import logging
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+
+import VAT_lazy
+import VAT_manifest
+
+coordinates = VAT_lazy.module("astropy.coordinates")
+u = VAT_lazy.module("astropy.units")
+
+
+def defaultCacheDir():
+    """
+    répertoire racine des caches VAT (variable d'environnement VAT_CACHE_DIR, sinon ~/.cache/VAT)
+    """
+    return os.environ.get("VAT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "VAT"))
+
+
+class CutoutCache:
+    """
+    cache disque des images SkyView, adressé par le contenu de la requête
+    (survey, centre, rayon, pixels). Éviction LRU sur la taille totale, durée de vie optionnelle.
+    Le répertoire peut être partagé par plusieurs processus: un fichier absent de l'index est cherché
+    sur disque, un fichier disparu est un défaut de cache, et l'éviction relit le répertoire sous un verrou
+    de fichier, dans l'ordre des derniers accès enregistrés sur disque (atime)
+    """
+
+    def __init__(self, directory=None, maxBytes=2*1024**3, ttl=None):
+        if directory is None:
+            directory = os.path.join(defaultCacheDir(), "cutouts")
+        logging.info("init CutoutCache %s maxBytes: %d ttl: %s"%(directory, maxBytes, ttl))
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.lockName = os.path.join(self.directory, "cutouts")
+        self.scan()
+
+    def scan(self):
+        """
+        reconstruit l'index clé -> [taille, dernier accès, création] à partir du répertoire
+        """
+        self.index = {}
+        self.totalBytes = 0
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.fits'):
+                    try:
+                        st = os.stat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        # --- supprimé par un autre processus pendant le parcours
+                        continue
+                    self.index[name[:-5]] = [st.st_size, st.st_atime, st.st_mtime]
+                    self.totalBytes += st.st_size
+
+    @staticmethod
+    def key(survey, center, radius, pixels):
+        """
+        clé normalisée d'une requête: un centre SkyCoord est arrondi au 1/1000 de seconde d'arc,
+        un nom d'objet est mis en majuscules sans espaces
+        """
+        if isinstance(center, coordinates.SkyCoord):
+            center = "%.7f,%.7f"%(center.icrs.ra.degree, center.icrs.dec.degree)
+        else:
+            center = "".join(str(center).split()).upper()
+        radius = u.Quantity(radius, u.deg).to_value(u.deg)
+        request = [survey, center, "%.9g"%radius, int(pixels)]
+        return hashlib.sha256(json.dumps(request).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.fits')
+
+    def get(self, key):
+        """
+        chemin du fichier en cache, ou None
+        """
+        with self.lock:
+            fileName = self.path(key)
+            entry = self.index.get(key)
+            if entry is None:
+                # --- écrit par un autre processus depuis la lecture du répertoire
+                try:
+                    st = os.stat(fileName)
+                except FileNotFoundError:
+                    return None
+                entry = [st.st_size, st.st_atime, st.st_mtime]
+                self.index[key] = entry
+                self.totalBytes += st.st_size
+            now = time.time()
+            if self.ttl is not None and now - entry[2] > self.ttl:
+                self.remove(key)
+                return None
+            try:
+                os.utime(fileName, (now, entry[2]))
+            except FileNotFoundError:
+                # --- évincé par un autre processus
+                self.remove(key)
+                return None
+            entry[1] = now
+            return fileName
+
+    def put(self, key, fileName):
+        """
+        copier un fichier FITS dans le cache
+        """
+        self.store(key, lambda tmpName: shutil.copyfile(fileName, tmpName))
+
+    def putHDU(self, key, hdu):
+        self.store(key, lambda tmpName: hdu.writeto(tmpName, overwrite=True, output_verify="ignore"))
+
+    def store(self, key, write):
+        fileName = self.path(key)
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(fileName), suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmpName)
+            os.replace(tmpName, fileName)
+        except BaseException:
+            if os.path.exists(tmpName):
+                os.unlink(tmpName)
+            raise
+        now = time.time()
+        size = os.path.getsize(fileName)
+        with self.lock:
+            if key in self.index:
+                self.totalBytes -= self.index[key][0]
+            self.index[key] = [size, now, now]
+            self.totalBytes += size
+            self.evict(keep=key)
+
+    def discard(self, key):
+        """
+        retirer une entrée du cache, par exemple une image invalide
+        """
+        with self.lock:
+            if key in self.index:
+                self.remove(key)
+
+    def remove(self, key):
+        entry = self.index.pop(key)
+        self.totalBytes -= entry[0]
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep=None):
+        """
+        supprimer les entrées les moins récemment utilisées jusqu'à repasser sous maxBytes, sauf keep.
+        L'index est d'abord relu sur disque: il compte alors les fichiers des autres processus
+        et leurs derniers accès
+        """
+        if self.totalBytes <= self.maxBytes:
+            return
+        with VAT_manifest.fileLock(self.lockName):
+            self.scan()
+            for key in sorted(self.index, key=lambda k: self.index[k][1]):
+                if self.totalBytes <= self.maxBytes:
+                    break
+                if key == keep:
+                    continue
+                logging.info("cache eviction: %s"%key)
+                self.remove(key)
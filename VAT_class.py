@@ -1,11 +1,11 @@
 from astroquery.skyview import SkyView
 from astropy import units as u
-from astropy.coordinates import SkyCoord
 from astropy.coordinates import Angle
 from astropy.coordinates import position_angle
 import tkinter as tk
 from tkinter import ttk
 from astropy.wcs import WCS
+from astropy.io import fits
 from astropy.visualization import astropy_mpl_style
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
@@ -14,6 +14,13 @@ from astropy.visualization.wcsaxes import Quadrangle
 from matplotlib.patches import Rectangle
 from tkinter import filedialog
 import os
+import VAT_cache
+import VAT_http
+import VAT_resolver
+import VAT_stats
+
+# --- connexions SkyView persistantes et partagées
+VAT_http.mount(SkyView._session)
 
 #######################################################################################################################################
 #                                                      VAT - Virtual Astrophotographer Tool  
@@ -56,6 +63,8 @@ class VAT_App:
         self.fig_photo = None
         self.fig_photo_tiles = None
         self.nb_pixels = 2000
+        self.cache = VAT_cache.CutoutCache()
+        self.resolver = VAT_resolver.NameResolver()
 
     def retrieve_data(self):
         """
@@ -99,6 +108,27 @@ class VAT_App:
             print("That survey is not available. Please use : DDS1 Blue, DSS2 Blue, DSS2 Red', DSS2 IR.")
             return
 
+    def get_overview_hdu(self, nb_pixels):
+        """
+        Récupère l'aperçu DSS de l'objet, depuis le cache local s'il a déjà été téléchargé.
+
+        Args:
+            nb_pixels : nombre de pixels de l'aperçu
+
+        Returns:
+            hdu : l'image d'aperçu
+        """
+        key = self.cache.key('DSS', self.object, self.fov, nb_pixels)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with fits.open(cached, memmap=False) as hdul:
+                hdu = hdul[0]
+                hdu.data
+            return hdu
+        hdu = SkyView.get_images(self.object, survey=['DSS'],pixels=nb_pixels,radius=self.fov)[0][0]
+        self.cache.putHDU(key, hdu)
+        return hdu
+
     def SNR_calculation(self, picture):
         """
         Calcule le rapport signal/bruit d'une image et le niveau de bruit moyen.
@@ -112,11 +142,8 @@ class VAT_App:
         Returns:
             tuple: Rapport signal/bruit et niveau de bruit moyen.
         """
-        signal_mean = np.mean(picture)
-        noise = picture - signal_mean
-        noise_mean = np.mean(noise)
-        noise_std = np.std(noise)
-        snr = signal_mean / noise_std
+        # Calcul en un seul passage, par bandes de lignes et en ignorant les NaN (voir VAT_stats)
+        snr, noise_mean = VAT_stats.snrCalculation(picture)
         return snr, noise_mean
 
     def calculate_number_tiles(self):
@@ -162,7 +189,7 @@ class VAT_App:
 
         """
         # print("Execution de tile coordinates")
-        self.center_coords = SkyCoord.from_name(self.object)
+        self.center_coords = self.resolver.coordinates(self.object)
         self.offset_value = (self.tile_fov*(1-self.cover_pct/100.) )* u.deg
         # Direction de référence pour le décalage suivant les 
         # déclinaisons positives, on a pris pi/4 arbitrairement. Il fallait logiquement une valeur entre 0. et pi/2.
@@ -176,13 +203,11 @@ class VAT_App:
         coord_starting_point1 = self.center_coords.directional_offset_by(position_angle_RAmoins,self.offset_value/2.*float(self.number_tiles))
         coord_starting_point = coord_starting_point1.directional_offset_by(position_angle_DECmoins,self.offset_value/2.*float(self.number_tiles))
         # On applique ensuite le décalage pour déterminer l'emplacement de chaque tuile à partir de cette nouvelle origine
-        self.tile_coordinates_center = []
-        for i in range(self.number_tiles):
-            for j in range(self.number_tiles):
-                coord_tile_step1 = coord_starting_point.directional_offset_by(position_angle_RAplus,self.offset_value*float(i))
-                coord_tile_final = coord_tile_step1.directional_offset_by(position_angle_DECplus,self.offset_value*float(j))
-                self.tile_coordinates_center.append(coord_tile_final)
-                print("Coordinates of tile "+str(i+1)+"x"+str(j+1)+" :"+str(coord_tile_final))
+        # Tous les centres sont calculés en une seule opération sur des tableaux (i, j) aplatis dans l'ordre des tuiles
+        i, j = np.meshgrid(np.arange(self.number_tiles), np.arange(self.number_tiles), indexing='ij')
+        coord_tile_step1 = coord_starting_point.directional_offset_by(position_angle_RAplus,self.offset_value*i.ravel())
+        self.tile_coordinates_center = coord_tile_step1.directional_offset_by(position_angle_DECplus,self.offset_value*j.ravel())
+        print("Coordinates of "+str(len(self.tile_coordinates_center))+" tiles computed")
         # print(self.tile_coordinates_center)
         # print(np.shape(self.tile_coordinates_center))
 
@@ -200,7 +225,7 @@ class VAT_App:
         if self.object is not None:
             # images = SkyView.get_images(self.object, survey='DSS')[0][0]
             # image_Ha = SkyView.get_images(self.objet, survey='H-Alpha Comp')[0][0]
-            hdu = SkyView.get_images(self.object, survey=['DSS'],pixels=np.int64(np.round(nb_pixels/2.)),radius=self.fov)[0][0]
+            hdu = self.get_overview_hdu(np.int64(np.round(nb_pixels/2.)))
             wcs = WCS(hdu.header)
             snr_visible, noise_mean_visible = self.SNR_calculation(hdu.data)
 
@@ -265,7 +290,7 @@ class VAT_App:
         if self.object is not None:
             # images = SkyView.get_images(self.object, survey='DSS')[0][0]
             # image_Ha = SkyView.get_images(self.objet, survey='H-Alpha Comp')[0][0]
-            hdu = SkyView.get_images(self.object, survey=['DSS'],pixels=np.int64(np.round(nb_pixels/2.)),radius=self.fov)[0][0]
+            hdu = self.get_overview_hdu(np.int64(np.round(nb_pixels/2.)))
             wcs = WCS(hdu.header)
             # print(wcs)
             snr_visible, noise_mean_visible = self.SNR_calculation(hdu.data)
@@ -0,0 +1,202 @@
+import os
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+from urllib.parse import urlparse
+
+import VAT_http
+import VAT_metrics
+
+FITS_BLOCK = 2880
+
+
+class RateLimiter:
+    """
+    limite le nombre de requêtes par seconde envoyées à un serveur
+    """
+
+    def __init__(self, requestsPerSecond):
+        self.interval = 1./requestsPerSecond
+        self.nextTime = 0.
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        attendre le prochain créneau libre
+        """
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.nextTime)
+            self.nextTime = start + self.interval
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DownloadScheduler:
+    """
+    pool de threads borné pour les téléchargements SkyView,
+    avec limitation optionnelle du débit par serveur
+    """
+
+    def __init__(self, maxWorkers=4, requestsPerSecond=None, maxAttempts=5, baseDelay=1., maxDelay=60., metrics=None, timeout=None):
+        logging.info("init DownloadScheduler maxWorkers: %d requestsPerSecond: %s"%(maxWorkers, requestsPerSecond))
+        self.maxWorkers = maxWorkers
+        self.requestsPerSecond = requestsPerSecond
+        self.maxAttempts = maxAttempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="VAT_download")
+        self.limiters = {}
+        self.lock = threading.Lock()
+        # --- connexions persistantes partagées avec les requêtes SkyView
+        self.session = VAT_http.session()
+        # --- délai de lecture de ce pool, None: délais par défaut de l'adaptateur partagé (VAT_http)
+        self.timeout = VAT_http.timeouts(timeout)
+        if metrics is None:
+            metrics = VAT_metrics.Metrics()
+        self.metrics = metrics
+
+    def throttle(self, url):
+        """
+        bloque jusqu'à ce que le serveur de l'url accepte une nouvelle requête
+        """
+        if self.requestsPerSecond is None:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                limiter = RateLimiter(self.requestsPerSecond)
+                self.limiters[host] = limiter
+        with self.metrics.span("throttle", host=host):
+            limiter.acquire()
+
+    def backoff(self, attempt, cancelEvent=None):
+        """
+        attente avant la tentative suivante: exponentielle, plafonnée, avec gigue complète.
+        Interrompue dès que cancelEvent est positionné: retourne alors True
+        """
+        delay = random.uniform(0., min(self.maxDelay, self.baseDelay * 2**attempt))
+        logging.info("retry in %.1f s (attempt %d/%d)"%(delay, attempt + 1, self.maxAttempts))
+        self.metrics.count("retries")
+        with self.metrics.span("backoff", attempt=attempt + 1):
+            if cancelEvent is None:
+                time.sleep(delay)
+                return False
+            return cancelEvent.wait(delay)
+
+    def streamToFile(self, url, fileName, chunkSize=1 << 20):
+        """
+        écrit la réponse directement sur disque par blocs, sans la décoder en HDU:
+        la mémoire utilisée ne dépend pas de la taille de l'image.
+        Le fichier final n'apparaît qu'une fois complet et vérifié. Retourne le nombre d'octets.
+        Métriques: attente de la réponse (wait), réception (transfer) et écriture disque (write)
+        """
+        self.throttle(url)
+        partName = fileName + '.part'
+        nbytes = 0
+        name = os.path.basename(fileName)
+        try:
+            self.metrics.count("fits_requests")
+            with self.metrics.span("wait", file=name):
+                response = self.session.get(url, stream=True, timeout=self.timeout)
+            with response:
+                response.raise_for_status()
+                transfer = 0.
+                write = 0.
+                with open(partName, 'wb') as f:
+                    t0 = time.perf_counter()
+                    for chunk in response.iter_content(chunk_size=chunkSize):
+                        t1 = time.perf_counter()
+                        transfer += t1 - t0
+                        if nbytes == 0 and not chunk.startswith(b'SIMPLE'):
+                            raise IOError("not a FITS file: %s"%url)
+                        f.write(chunk)
+                        nbytes += len(chunk)
+                        t0 = time.perf_counter()
+                        write += t0 - t1
+                self.metrics.record("transfer", transfer, file=name, bytes=nbytes)
+                self.metrics.record("write", write, file=name, bytes=nbytes)
+                self.metrics.count("download_bytes", nbytes)
+            if nbytes == 0 or nbytes % FITS_BLOCK != 0:
+                raise IOError("truncated FITS file (%d bytes): %s"%(nbytes, url))
+            os.replace(partName, fileName)
+        except BaseException:
+            self.metrics.count("fits_errors")
+            if os.path.exists(partName):
+                os.unlink(partName)
+            raise
+        return nbytes
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def runTask(self, stage, fn, *args):
+        """
+        exécute une tâche en mesurant sa durée et le nombre de tâches simultanées
+        """
+        with self.metrics.inUse(stage), self.metrics.span(stage):
+            return fn(*args)
+
+    def run(self, tasks, callback=None, cancelEvent=None, stage="task"):
+        """
+        exécute une liste de (fonction, arguments) et retourne les résultats dans l'ordre des tâches.
+        callback(k, résultat) est appelé à la fin de chaque tâche.
+        Si cancelEvent est positionné, les tâches non démarrées sont abandonnées (résultat None)
+        et on attend seulement la fin des tâches en cours.
+        La durée des tâches est mesurée sous le nom stage
+        """
+        remaining = iter(tasks)
+        results = self.runQueue(lambda: next(remaining, None), callback, cancelEvent, stage, max(1, len(tasks)))
+        return results + [None]*(len(tasks) - len(results))
+
+    def runQueue(self, nextTask, callback=None, cancelEvent=None, stage="task", maxPending=None):
+        """
+        exécute les tâches données une à une par nextTask(): (fonction, arguments), None quand il n'y en a plus.
+        Au plus maxPending tâches (par défaut maxWorkers) sont soumises à la fois, une nouvelle est demandée
+        dès qu'une autre se termine: une tâche lente n'arrête pas les autres threads, et nextTask peut tenir
+        compte des tâches déjà terminées. callback(k, résultat) est appelé à la fin de la k-ième tâche.
+        Si cancelEvent est positionné, plus aucune tâche n'est demandée, les tâches non démarrées sont
+        abandonnées (résultat None) et on attend seulement la fin des tâches en cours.
+        Retourne les résultats dans l'ordre des tâches
+        """
+        if maxPending is None:
+            maxPending = self.maxWorkers
+        futures = {}
+        results = []
+        notDone = set()
+        exhausted = False
+        while True:
+            if cancelEvent is not None and cancelEvent.is_set():
+                for future in notDone:
+                    future.cancel()
+            else:
+                while not exhausted and len(notDone) < maxPending:
+                    task = nextTask()
+                    if task is None:
+                        exhausted = True
+                        break
+                    (fn, args) = task
+                    future = self.submit(self.runTask, stage, fn, *args)
+                    futures[future] = len(results)
+                    results.append(None)
+                    notDone.add(future)
+            if len(notDone) == 0:
+                break
+            done, notDone = wait(notDone, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                k = futures[future]
+                results[k] = future.result()
+                if callback is not None:
+                    callback(k, results[k])
+        return results
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
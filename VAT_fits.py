@@ -0,0 +1,72 @@
+import os
+import logging
+
+import numpy as np
+
+from astropy.io import fits
+
+# --- formats de sortie des tuiles: algorithme de compression par tuiles de CompImageHDU,
+#     None pour un fits non compressé, "auto" pour Rice sur les entiers et GZIP quantifié sur les réels
+FORMATS = {"fits": None,
+           "compressed": "auto",
+           "rice": "RICE_1",
+           "gzip": "GZIP_2"}
+
+QUANTIZE_LEVEL = 16.
+
+
+def imageHDU(hdul):
+    """
+    première image non vide du fichier: le HDU primaire d'un fits simple,
+    l'extension CompImageHDU d'un fits compressé
+    """
+    return next((h for h in hdul if h.is_image and h.header.get("NAXIS", 0) > 0), None)
+
+
+def readRows(hdu, y0, y1):
+    """
+    lignes [y0, y1) d'une image en réels, par hdu.section: seules ces lignes sont lues d'un fits simple,
+    seules les tuiles de compression qui les contiennent sont décompressées.
+    Le fichier doit être ouvert avec do_not_scale_image_data: BSCALE/BZERO/BLANK sont appliqués ici
+    """
+    raw = hdu.section[y0:y1]
+    data = np.asarray(raw, dtype=np.float64)
+    if "BLANK" in hdu.header and np.issubdtype(raw.dtype, np.integer):
+        data[raw == hdu.header["BLANK"]] = np.nan
+    return data*hdu.header.get("BSCALE", 1.) + hdu.header.get("BZERO", 0.)
+
+
+def compressionType(outputFormat, data):
+    compression = FORMATS[outputFormat]
+    if compression == "auto":
+        compression = "RICE_1" if data.dtype.kind in "iu" else "GZIP_2"
+    return compression
+
+
+def compressFits(fileName, outputFormat="fits"):
+    """
+    réécrit un fits téléchargé au format de sortie demandé (clé "outputFormat" des spécifications).
+    Les entiers sont compressés sans perte, avec leurs BSCALE/BZERO d'origine;
+    les réels sont quantifiés (QUANTIZE_LEVEL niveaux par écart type du bruit) avant compression.
+    Retourne la taille du fichier écrit
+    """
+    if FORMATS[outputFormat] is None:
+        return os.path.getsize(fileName)
+    tmpName = fileName + ".part"
+    with fits.open(fileName, do_not_scale_image_data=True) as hdul:
+        hdu = imageHDU(hdul)
+        if hdu is None or isinstance(hdu, fits.CompImageHDU):
+            return os.path.getsize(fileName)
+        data = hdu.data
+        compression = compressionType(outputFormat, data)
+        comp = fits.CompImageHDU(data, hdu.header, compression_type=compression,
+                                 quantize_level=QUANTIZE_LEVEL)
+        for k in ("BSCALE", "BZERO", "BLANK"):
+            if k in hdu.header:
+                comp.header[k] = hdu.header[k]
+        fits.HDUList([fits.PrimaryHDU(), comp]).writeto(tmpName, overwrite=True, output_verify="ignore")
+    before = os.path.getsize(fileName)
+    os.replace(tmpName, fileName)
+    after = os.path.getsize(fileName)
+    logging.info("    %s compressed with %s: %d -> %d bytes"%(fileName, compression, before, after))
+    return after
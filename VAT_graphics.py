@@ -10,16 +10,21 @@ import matplotlib
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
-
-from astropy.io import fits
-from astropy.wcs import WCS
-from astropy.visualization import astropy_mpl_style
-from astropy.visualization.wcsaxes import Quadrangle
-from astropy import units as u
-from astropy.coordinates import SkyCoord
+from matplotlib.collections import LineCollection
 
 import logging
 
+import numpy as np
+
+import VAT_lazy
+
+# --- astropy n'est chargé qu'au premier affichage d'une image
+wcs = VAT_lazy.module("astropy.wcs")
+visualization = VAT_lazy.module("astropy.visualization")
+u = VAT_lazy.module("astropy.units")
+coordinates = VAT_lazy.module("astropy.coordinates")
+VAT_pyramid = VAT_lazy.module("VAT_pyramid")
+
 class VATgraphics(QWidget):
     def __init__(self, parent=None):
         '''
@@ -33,45 +38,53 @@ class VATgraphics(QWidget):
 
         self.figure = Figure()
         self.canvas = FigureCanvas(self.figure)
-        matplotlib.style.use(astropy_mpl_style)
+        self.styled = False
         self.toolbar = NavigationToolbar(self.canvas, self)
+        self.canvas.mpl_connect('draw_event', self.onDraw)
 
         # set the layout
         layout = QVBoxLayout()
         layout.addWidget(self.toolbar)
         layout.addWidget(self.canvas)
         self.setLayout(layout)
+        self.pyramid = None
         self.reset()
 
     def reset(self):
         logging.info("VATgraphics.reset")
         self.overviewTiles = False
+        self.tilesOverlay = None
+        self.background = None
         self.hdu = None
         self.title = ""
+        if self.pyramid is not None:
+            self.pyramid.close()
+            self.pyramid = None
         self.figure.clear()
         self.canvas.draw()
 
     def resetOverviewTiles(self):
+        """
+        the tiles changed: hide the outlines, they will be recomputed
+        """
+        if self.tilesOverlay is not None:
+            self.tilesOverlay.remove()
+            self.tilesOverlay = None
         if self.overviewTiles:
-            self.plotOverviewTiles([], 0, 0)
+            self.overviewTiles = False
+            self.blitTiles()
 
-    def plotImage(self, imageFile, title=None):
+    def plotImage(self, imageFile, title=None, binning=False):
         '''
         plot a .fits image
         projection is extracted from the image header
+        the file is opened once, memory mapped, and displayed through a multi-resolution pyramid
         '''
         logging.info("VATgraphics plot fits image")
         if title is None:
             title = os.path.basename(imageFile)
-        self.figure.clear()
-        self.figure.suptitle(title)
-        data = fits.getdata(imageFile, ext=0)
-        header = fits.getheader(imageFile)
-        wcs = WCS(header)
-        self.ax = self.figure.add_subplot(projection=wcs)
-        imgplot = self.ax.imshow(data, cmap='binary_r', origin='lower')
-        self.canvas.draw()
-
+        header, pyramid = VAT_pyramid.pyramidForFile(imageFile, binning)
+        self.showPyramid(pyramid, header, title)
 
     def plotHDU(self, hdu=None, title=None):
         '''
@@ -88,36 +101,112 @@ class VATgraphics(QWidget):
             if title is None:
                 title = "no name"
             self.title = title
-        self.figure.clear()
         if hdu is not None:
-            self.figure.suptitle(title)
-            data = hdu.data
-            header = hdu.header
-            wcs = WCS(header)
-            self.ax = self.figure.add_subplot(projection=wcs)
-            imgplot = self.ax.imshow(data, cmap='binary_r', origin='lower')
+            self.showPyramid(VAT_pyramid.pyramidForHDU(hdu), hdu.header, title)
+        else:
+            self.figure.clear()
+            self.overviewTiles = False
+            self.tilesOverlay = None
+            self.canvas.draw()
+
+    def showPyramid(self, pyramid, header, title):
+        '''
+        display the level of the pyramid matching the zoom:
+        on pan and zoom only the visible block of that level is read
+        '''
+        self.figure.clear()
+        self.overviewTiles = False
+        self.tilesOverlay = None
+        self.figure.suptitle(title)
+        if self.pyramid is not None and self.pyramid is not pyramid:
+            self.pyramid.close()
+        self.pyramid = pyramid
+        if not self.styled:
+            matplotlib.style.use(visualization.astropy_mpl_style)
+            self.styled = True
+        self.ax = self.figure.add_subplot(projection=wcs.WCS(header))
+        self.ax.grid(color='black',ls='solid')
+        ny, nx = pyramid.shape
+        self.ax.set_xlim(-0.5, nx - 0.5)
+        self.ax.set_ylim(-0.5, ny - 0.5)
+        # --- same color scale for all levels, taken on the coarsest one
+        coarse = pyramid.physical(pyramid.level(pyramid.nbLevels - 1), pyramid.nbLevels - 1)
+        self.imgplot = self.ax.imshow(np.zeros((1, 1)), cmap='binary_r', origin='lower',
+                                      vmin=np.nanmin(coarse), vmax=np.nanmax(coarse))
+        self.updateView()
+        self.ax.callbacks.connect('xlim_changed', self.updateView)
+        self.ax.callbacks.connect('ylim_changed', self.updateView)
         self.canvas.draw()
 
+    def updateView(self, ax=None):
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        k = self.pyramid.levelFor((x1 - x0)/max(1., self.ax.bbox.width))
+        block, extent = self.pyramid.read(k, x0, x1, y0, y1)
+        self.imgplot.set_visible(block is not None)
+        if block is not None:
+            self.imgplot.set_data(block)
+            self.imgplot.set_extent(extent)
+
     def plotOverviewTiles(self, tileCoordinatesCenters, nbTiles, tileFov):
         """
+        show or hide the tile outlines over the overview.
+        The outlines are a single LineCollection, drawn over the cached background by blitting:
+        the overview image is not redrawn
         """
         logging.info("VATgraphics plotOverviewTiles")
-        self.plotHDU()
         self.overviewTiles = not self.overviewTiles
         if self.overviewTiles:
-            self.ax.grid(color='black',ls='solid')
-            colors = ["red", "green", "blue", "yellow"] # --- pour que tous les voisins aient des couleurs différentes
-            for i in range(len(tileCoordinatesCenters)):
-                c1 = SkyCoord("0h0m0s", tileCoordinatesCenters[i].dec.degree*u.deg)
-                c2 = SkyCoord("0h4m0s", tileCoordinatesCenters[i].dec.degree*u.deg)
-                sep = c1.separation(c2).arcmin/60.
-                decal = 2*((i // nbTiles)%2) # --- pour decaler de 2 couleurs d'une rangée à l'autre
-                r = Quadrangle( tuple([tileCoordinatesCenters[i].ra.degree -0.5/sep*tileFov,
-                                       tileCoordinatesCenters[i].dec.degree -0.5*tileFov])*u.deg,
-                                (1./sep)*tileFov*u.deg,
-                                tileFov*u.deg,
-                                edgecolor=colors[(i%nbTiles+decal)%len(colors)],
-                                facecolor='none',
-                                transform=self.ax.get_transform('world'))
-                self.ax.add_patch(r)
+            tiles = (id(tileCoordinatesCenters), nbTiles, tileFov)
+            if self.tilesOverlay is None or self.tiles != tiles:
+                self.setTilesOverlay(tileCoordinatesCenters, nbTiles, tileFov)
+                self.tiles = tiles
+        self.blitTiles()
+
+    def setTilesOverlay(self, tileCoordinatesCenters, nbTiles, tileFov, resolution=20):
+        """
+        outlines of all the tiles, computed with array operations
+        """
+        if self.tilesOverlay is not None:
+            self.tilesOverlay.remove()
+            self.tilesOverlay = None
+        nb = len(tileCoordinatesCenters)
+        if nb == 0:
+            return
+        ra = np.atleast_1d(tileCoordinatesCenters.ra.degree)
+        dec = np.atleast_1d(tileCoordinatesCenters.dec.degree)
+        c1 = coordinates.SkyCoord(0.*u.deg, dec*u.deg)
+        c2 = coordinates.SkyCoord(1.*u.deg, dec*u.deg)
+        sep = c1.separation(c2).degree
+        # --- contour de chaque tuile, parcouru dans l'ordre des coins, avec resolution points par côté
+        t = np.linspace(0., 1., resolution, endpoint=False)
+        du = np.concatenate([t, np.ones_like(t), 1. - t, np.zeros_like(t), [0.]]) - 0.5
+        dv = np.concatenate([np.zeros_like(t), t, np.ones_like(t), 1. - t, [0.]]) - 0.5
+        segments = np.empty((nb, len(du), 2))
+        segments[:, :, 0] = ra[:, None] + du[None, :]*tileFov/sep[:, None]
+        segments[:, :, 1] = dec[:, None] + dv[None, :]*tileFov
+        colors = np.array(["red", "green", "blue", "yellow"]) # --- pour que tous les voisins aient des couleurs différentes
+        i = np.arange(nb)
+        decal = 2*((i // nbTiles)%2) # --- pour decaler de 2 couleurs d'une rangée à l'autre
+        self.tilesOverlay = LineCollection(segments,
+                                           colors=colors[(i%nbTiles + decal)%len(colors)],
+                                           transform=self.ax.get_transform('world'),
+                                           animated=True)
+        self.ax.add_collection(self.tilesOverlay, autolim=False)
+
+    def onDraw(self, event):
+        """
+        after a full draw (zoom, pan, resize): keep the background, then draw the tiles over it
+        """
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        if self.overviewTiles and self.tilesOverlay is not None:
+            self.ax.draw_artist(self.tilesOverlay)
+
+    def blitTiles(self):
+        if self.background is None:
             self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        if self.overviewTiles and self.tilesOverlay is not None:
+            self.ax.draw_artist(self.tilesOverlay)
+        self.canvas.blit(self.figure.bbox)
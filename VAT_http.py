@@ -0,0 +1,119 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.adapters import HTTPAdapter
+
+# --- nombre de serveurs dont les connexions sont gardées (SkyView, Simbad, Sesame, serveur de remplacement)
+POOL_HOSTS = 8
+# --- connexions persistantes gardées par serveur: au moins une par thread de téléchargement
+POOL_SIZE = 16
+# --- délais par défaut (secondes) d'établissement de la connexion et de lecture de la réponse
+CONNECT_TIMEOUT = 10.
+READ_TIMEOUT = 120.
+
+_adapter = None
+_lock = threading.Lock()
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    adaptateur requests partagé par toutes les sessions (SkyView, Simbad, téléchargements):
+    connexions persistantes (keep-alive) réutilisées d'une requête à l'autre, poolSize par serveur,
+    et délais (connexion, lecture) appliqués aux requêtes qui n'en donnent pas
+    """
+
+    def __init__(self, poolSize=POOL_SIZE, connectTimeout=CONNECT_TIMEOUT, readTimeout=READ_TIMEOUT):
+        self.poolSize = poolSize
+        self.timeout = (connectTimeout, readTimeout)
+        super().__init__(pool_connections=POOL_HOSTS, pool_maxsize=poolSize)
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return super().send(request, stream=stream, timeout=timeout, **kwargs)
+
+    def resize(self, poolSize):
+        """
+        change la taille du pool: les connexions ouvertes sont refermées
+        """
+        logging.info("http pool size %d -> %d"%(self.poolSize, poolSize))
+        self.poolSize = poolSize
+        self.poolmanager.clear()
+        self.init_poolmanager(POOL_HOSTS, poolSize)
+
+    def stats(self):
+        """
+        {serveur: (connexions ouvertes, requêtes envoyées)}: moins de connexions que de requêtes
+        indique que les connexions sont réutilisées
+        """
+        pools = self.poolmanager.pools
+        stats = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                stats[pool.host] = (pool.num_connections, pool.num_requests)
+        return stats
+
+
+class TimeoutAdapter(BaseAdapter):
+    """
+    délais propres à une session sur les connexions de l'adaptateur partagé:
+    ils remplacent ceux donnés à chaque requête, y compris le TIMEOUT d'astroquery
+    """
+
+    def __init__(self, pooled, timeout):
+        super().__init__()
+        self.pooled = pooled
+        self.timeout = timeout
+
+    def send(self, request, timeout=None, **kwargs):
+        return self.pooled.send(request, timeout=self.timeout, **kwargs)
+
+    def close(self):
+        # --- les connexions appartiennent à l'adaptateur partagé
+        pass
+
+
+def adapter(poolSize=None):
+    """
+    adaptateur unique du processus; poolSize donne le nombre de connexions gardées par serveur
+    """
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            _adapter = PooledAdapter(POOL_SIZE if poolSize is None else poolSize)
+        elif poolSize is not None and poolSize != _adapter.poolSize:
+            _adapter.resize(poolSize)
+        return _adapter
+
+
+def timeouts(readTimeout):
+    """
+    (connexion, lecture) pour un délai de lecture en secondes, None pour les délais par défaut
+    """
+    return None if readTimeout is None else (CONNECT_TIMEOUT, readTimeout)
+
+
+def mount(session, timeout=None):
+    """
+    fait passer les requêtes http et https de la session par l'adaptateur partagé;
+    timeout (délai de lecture en secondes) vaut pour cette session seulement
+    """
+    pooled = adapter()
+    if timeout is not None:
+        pooled = TimeoutAdapter(pooled, timeouts(timeout))
+    session.mount("http://", pooled)
+    session.mount("https://", pooled)
+    return session
+
+
+def session(timeout=None):
+    return mount(requests.Session(), timeout)
+
+
+def logStats():
+    if _adapter is not None:
+        for host, (connections, requests) in sorted(_adapter.stats().items()):
+            logging.info("http %s: %d connections for %d requests"%(host, connections, requests))
@@ -2,23 +2,119 @@ import os
 import logging
 import json
 import shutil
+import time
+from urllib import parse as urlparse
 
 import numpy as np
 
-from astroquery.simbad import Simbad
-from astroquery.skyview import SkyView
+import VAT_batching
+import VAT_cache
+import VAT_download
+import VAT_http
+import VAT_lazy
+import VAT_manifest
+import VAT_metrics
+import VAT_resolver
+import VAT_tileindex
 
-from astropy.coordinates import SkyCoord
-from astropy.coordinates import position_angle
-from astropy import units as u
+# --- modules lourds chargés à la première utilisation
+skyview = VAT_lazy.module("astroquery.skyview", lambda m: VAT_http.mount(m.SkyView._session))
+coordinates = VAT_lazy.module("astropy.coordinates")
+fits = VAT_lazy.module("astropy.io.fits")
+u = VAT_lazy.module("astropy.units")
+VAT_fits = VAT_lazy.module("VAT_fits")
+VAT_mosaic = VAT_lazy.module("VAT_mosaic")
+VAT_quality = VAT_lazy.module("VAT_quality")
+VAT_standin = VAT_lazy.module("VAT_standin")
+VAT_stats = VAT_lazy.module("VAT_stats")
+
+def specsChannels(specs):
+    """
+    surveys choisis dans les spécifications, et leurs noms utilisés dans les fichiers
+    """
+    allChannels = [specs["cb_surveyChannel1"],
+                   specs["cb_surveyChannel2"],
+                   specs["cb_surveyChannel3"],
+                   specs["cb_surveyChannel4"]]
+    channels = []
+    chanames = []
+    for j in range(len(allChannels)):
+        if allChannels[j] != "none":
+            channels.append(allChannels[j])
+            chanames.append(allChannels[j].replace(' ', '_'))
+    return channels, chanames
+
+def servicesCacheDir(baseUrl):
+    """
+    répertoire de cache propre à un serveur de remplacement, par exemple VAT_standin:
+    ses images et ses noms ne doivent pas se mélanger à ceux des services réels
+    """
+    netloc = urlparse.urlparse(baseUrl).netloc
+    return os.path.join(VAT_cache.defaultCacheDir(), "services", netloc.replace(':', '_'))
 
 class VAT_interface:
     """
     interface d'acces VAT_Class, AstroQuery
     """
 
-    def __init__(self):
+    def __init__(self, maxWorkers=4, requestsPerSecond=None, maxAttempts=5, cache=None, offline=False, maxRefetch=2,
+                 baseUrl=None, metrics=None, batching=True, poolSize=None, timeout=None,
+                 reuseTolerance=VAT_tileindex.TOLERANCE):
+        """
+        baseUrl (par défaut la variable d'environnement VAT_BASE_URL) remplace les services SkyView et Simbad
+        par un serveur compatible, par exemple VAT_standin: les noms sont alors résolus par Sesame.
+        metrics (VAT_metrics.Metrics) reçoit la durée de chaque étape.
+        Avec batching, les petites tuiles voisines sont demandées par blocs (VAT_batching).
+        poolSize (par défaut 2 x maxWorkers) connexions persistantes par serveur sont partagées par SkyView,
+        Simbad et les téléchargements (VAT_http); timeout est le délai de lecture des réponses de cette interface, en secondes.
+        Une tuile du cache dont le centre est à moins de reuseTolerance x côté du centre demandé est réutilisée
+        (VAT_tileindex); 0 pour n'utiliser que les tuiles de même centre
+        """
         logging.info("init VAT_interface")
+        VAT_http.adapter(poolSize if poolSize is not None else 2*maxWorkers)
+        self.timeout = timeout
+        self.maxRefetch = maxRefetch
+        if baseUrl is None:
+            baseUrl = os.environ.get("VAT_BASE_URL")
+        if baseUrl is not None:
+            baseUrl = baseUrl.rstrip('/')
+        self.baseUrl = baseUrl
+        self.skyviewInstance = None
+        if baseUrl is None:
+            self.resolver = VAT_resolver.NameResolver(offline=offline, timeout=timeout)
+            if cache is None:
+                cache = VAT_cache.CutoutCache()
+        else:
+            logging.info("services %s"%baseUrl)
+            cacheDir = servicesCacheDir(baseUrl)
+            self.resolver = VAT_resolver.NameResolver(os.path.join(cacheDir, "names.json"), offline, useSimbad=False,
+                                                      sesameUrl=baseUrl + VAT_standin.SESAME_PATH, timeout=timeout)
+            if cache is None:
+                cache = VAT_cache.CutoutCache(os.path.join(cacheDir, "cutouts"))
+        if metrics is None:
+            metrics = VAT_metrics.Metrics()
+        self.metrics = metrics
+        self.scheduler = VAT_download.DownloadScheduler(maxWorkers, requestsPerSecond, maxAttempts, metrics=metrics, timeout=timeout)
+        self.cache = cache
+        self.tileIndex = VAT_tileindex.TileIndex(os.path.join(cache.directory, "tiles.json"), reuseTolerance)
+        self.batcher = VAT_batching.AdaptiveBatcher(enabled=batching)
+
+    def skyviewService(self):
+        """
+        service SkyView de cette interface: l'instance partagée d'astroquery,
+        ou une instance propre dirigée vers baseUrl ou avec le délai timeout, sans toucher à l'instance partagée
+        """
+        if self.baseUrl is None and self.timeout is None:
+            return skyview.SkyView
+        if self.skyviewInstance is None:
+            service = skyview.SkyViewClass()
+            if self.baseUrl is not None:
+                service.URL = self.baseUrl + VAT_standin.SKYVIEW_PATH
+            if self.timeout is not None:
+                service.TIMEOUT = self.timeout
+            VAT_http.mount(service._session, self.timeout)
+            self.skyviewInstance = service
+        return self.skyviewInstance
 
     def checkObjName(self, objName):
         """
@@ -34,7 +130,8 @@ class VAT_interface:
         if catalogue is None:
             logging.warning("Catalogue non supporté. Veuillez utiliser NGC, M ou IC.")
             return False
-        result = Simbad.query_object(objName)
+        with self.metrics.span("resolve", name=objName):
+            result = self.resolver.query(objName)
         if result is None:
             logging.warning("object unknown in Simbad")
             return False
@@ -46,9 +143,26 @@ class VAT_interface:
         """
         logging.info("generateOverview")
         hdu = None
-        res = SkyView.get_images(objName, survey=['DSS'], pixels=nbPixels, radius=fovDegree*u.deg)
+        key = self.cache.key('DSS', objName, fovDegree*u.deg, nbPixels)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logging.info("overview from cache: %s"%cached)
+            try:
+                with fits.open(cached, memmap=False) as hdul:
+                    hdu = hdul[0]
+                    hdu.data
+                return hdu
+            except FileNotFoundError:
+                # --- évincé par un autre processus: téléchargé à nouveau
+                hdu = None
+        # --- position donnée par le résolveur: astroquery résoudrait le nom par le serveur Sesame global
+        with self.metrics.span("resolve", name=objName):
+            center = self.resolver.coordinates(objName)
+        with self.metrics.span("overview", name=objName):
+            res = self.skyviewService().get_images(center, survey=['DSS'], pixels=nbPixels, radius=fovDegree*u.deg)
         if len(res) > 0:
             hdu = res[0][0]
+            self.cache.putHDU(key, hdu)
         else:
             logging.warning("Overview is not found!")
         return hdu
@@ -65,70 +179,394 @@ class VAT_interface:
 
     def tilesCoordinates(self, objName, nbTiles, tileFov, cover):
         """
-        generer la liste des coordonnées des centres des tuiles
+        generer les coordonnées des centres des tuiles, sous forme d'un SkyCoord tableau
         """
         logging.info("tilesCoordinates")
-        center_coords = SkyCoord.from_name(objName)
+        with self.metrics.span("resolve", name=objName):
+            center_coords = self.resolver.coordinates(objName)
         offset_value =  tileFov*(1. - cover/100.)*u.deg
         # --- Direction de référence pour le décalage suivant les déclinaisons positives.
         #     on a pris pi/4 (radian) arbitrairement. Il fallait logiquement une valeur entre 0. et pi/2.
         #     angle = position_angle(lon1, lat1, lon2, lat2) : Position Angle (East of North) between two points on a sphere.
         #     https://docs.astropy.org/en/stable/api/astropy.coordinates.position_angle.html#astropy.coordinates.position_angle
         alpha = np.pi/4.
-        position_angle_DECplus  = position_angle(0., 0.,    0., alpha)
-        position_angle_DECmoins = position_angle(0., 0.,    0.,-alpha)
-        position_angle_RAplus   = position_angle(0., 0., alpha,    0.)
-        position_angle_RAmoins  = position_angle(0., 0.,-alpha,    0.)
+        position_angle_DECplus  = coordinates.position_angle(0., 0.,    0., alpha)
+        position_angle_DECmoins = coordinates.position_angle(0., 0.,    0.,-alpha)
+        position_angle_RAplus   = coordinates.position_angle(0., 0., alpha,    0.)
+        position_angle_RAmoins  = coordinates.position_angle(0., 0.,-alpha,    0.)
         # --- Translation du point de départ à partir des coordonnées du centre de l'objet ciblé
         coord_starting_point1 =         center_coords.directional_offset_by(position_angle_RAmoins,  (nbTiles-1)*offset_value/2.)
         coord_starting_point  = coord_starting_point1.directional_offset_by(position_angle_DECmoins, (nbTiles-1)*offset_value/2.)
-        # --- On applique ensuite le décalage pour déterminer l'emplacement de chaque tuile à partir de cette nouvelle origine
-        tile_coordinates_center = []
-        for i in range(nbTiles):
-            for j in range(nbTiles):
-                coord_tile_step1 = coord_starting_point.directional_offset_by(position_angle_RAplus,  offset_value*float(i))
-                coord_tile_final =     coord_tile_step1.directional_offset_by(position_angle_DECplus, offset_value*float(j))
-                tile_coordinates_center.append(coord_tile_final)
-                logging.info("Coordinates of tile (%s, %s): %s"%(i+1, j+1, coord_tile_final))
+        # --- On applique ensuite le décalage pour déterminer l'emplacement de chaque tuile à partir de cette nouvelle origine.
+        #     Tous les centres sont calculés en une seule opération sur des tableaux (i, j) aplatis dans l'ordre des tuiles.
+        i, j = np.meshgrid(np.arange(nbTiles), np.arange(nbTiles), indexing='ij')
+        coord_tile_step1 = coord_starting_point.directional_offset_by(position_angle_RAplus,  offset_value*i.ravel())
+        tile_coordinates_center =   coord_tile_step1.directional_offset_by(position_angle_DECplus, offset_value*j.ravel())
+        logging.info("Coordinates of %d tiles computed"%len(tile_coordinates_center))
         return tile_coordinates_center
 
-    def importFits(self, jsonSpecs, tileCoordinatesCenters, tileFov):
+    def importFits(self, jsonSpecs, tileCoordinatesCenters, tileFov, progress=None, cancelEvent=None):
+        """
+        télécharger les fits de toutes les tuiles.
+        progress(tuiles terminées, nombre de tuiles, octets écrits) est appelé après chaque tuile,
+        cancelEvent (threading.Event) permet d'interrompre l'import.
+        La clé "outputFormat" des spécifications choisit le format des fichiers (VAT_fits.FORMATS).
+        Après chaque passe, les tuiles sont validées (VAT_quality, rapport <cible>_quality.json):
+        les mauvaises sont retéléchargées, jusqu'à maxRefetch fois. Les passes de re-téléchargement
+        ne reprennent que ces tuiles: un canal en échec réseau a épuisé ses tentatives et attend un nouvel import.
+        Retourne la liste des échecs (clé, fichier, erreur)
+        """
         logging.info("importFits")
         specs = json.loads(jsonSpecs)
-        allChannels = [specs["cb_surveyChannel1"],
-                       specs["cb_surveyChannel2"],
-                       specs["cb_surveyChannel3"],
-                       specs["cb_surveyChannel4"]]
-        channels = []
-        chanames = []
-        results = []
-        for j in range(len(allChannels)):
-            if allChannels[j] != "none":
-                channels.append(allChannels[j])
-                chanames.append(allChannels[j].replace(' ', '_'))
-        dir = os.path.dirname(specs["targetSpecsFile"])
-        logging.info("=== get images async (get FileContainers) ===")
+        channels, chanames = specsChannels(specs)
+        nbPixels = specs["sb_nbPixels"]
+        outputFormat = specs.get("outputFormat", "fits")
+        if outputFormat not in VAT_fits.FORMATS:
+            raise ValueError("unknown outputFormat %s, expected one of %s"%(outputFormat, ", ".join(VAT_fits.FORMATS)))
+        manifest = VAT_manifest.JobManifest(specs["targetSpecsFile"])
+        plan = []
         for i in range(len(tileCoordinatesCenters)):
-            nb=0
+            plan.append([])
             for j in range(len(channels)):
                 fileImage = os.path.splitext(specs["targetSpecsFile"])[0] + '_' + chanames[j] + '_tile_' + str(i) + '.fits'
-                if os.path.isfile(fileImage):
-                    logging.info("file already existing: %s"%fileImage)
-                    nb += 1
-            if nb == len(channels):
+                plan[i].append((channels[j], fileImage, manifest.key(i, chanames[j])))
+        # --- réutilisation de tuiles d'autres plans seulement, à moins d'une fraction du pas de la grille
+        spacing = tileCoordinatesCenters[0].separation(tileCoordinatesCenters[1]).degree if len(tileCoordinatesCenters) > 1 else None
+        reuse = (os.path.abspath(specs["targetSpecsFile"]), self.tileIndex.maxDistance(tileFov, spacing))
+
+        failures = []
+        refetchKeys = None
+        for refetch in range(self.maxRefetch + 1):
+            with self.metrics.span("pass", target=os.path.basename(specs["targetSpecsFile"]), refetch=refetch):
+                failures += self.importPass(manifest, plan, nbPixels, tileCoordinatesCenters, tileFov, outputFormat, progress, cancelEvent, reuse, refetchKeys)
+            self.tileIndex.save()
+            manifest.compact()
+            if cancelEvent is not None and cancelEvent.is_set():
+                return failures
+            with self.metrics.span("quality"):
+                report = VAT_quality.checkTiles(manifest, [(key, fileImage) for tile in plan for (survey, fileImage, key) in tile], nbPixels)
+            VAT_quality.writeReport(report, specs["targetSpecsFile"])
+            bad = [(i, survey, fileImage, key) for i in range(len(plan)) for (survey, fileImage, key) in plan[i]
+                   if key in report and not report[key]["ok"]]
+            if len(bad) == 0:
+                break
+            refetchKeys = set()
+            for (i, survey, fileImage, key) in bad:
+                problems = report[key]["problems"]
+                if refetch < self.maxRefetch:
+                    # --- la tuile est retirée du cache et du disque, puis redemandée à la passe suivante
+                    self.discardTile(survey, tileCoordinatesCenters[i], nbPixels, tileFov, reuse)
+                    if os.path.isfile(fileImage):
+                        os.unlink(fileImage)
+                    manifest.setState(key, VAT_manifest.PENDING, quality=problems)
+                    refetchKeys.add(key)
+                else:
+                    error = "bad tile: " + ", ".join(problems)
+                    manifest.setState(key, VAT_manifest.FAILED, quality=problems, error=error)
+                    failures.append((key, fileImage, error))
+            if refetch < self.maxRefetch:
+                logging.warning("=== %d bad tiles, refetch %d/%d ==="%(len(bad), refetch + 1, self.maxRefetch))
+        manifest.compact()
+        logging.info("=== end of import: %d failed ==="%len(failures))
+        VAT_http.logStats()
+        return failures
+
+    def importPass(self, manifest, plan, nbPixels, tileCoordinatesCenters, tileFov, outputFormat="fits", progress=None, cancelEvent=None, reuse=None, keys=None):
+        """
+        une passe d'import: télécharger en parallèle les canaux non terminés de chaque tuile,
+        seulement ceux de keys si donné (tuiles rejetées par la validation).
+        reuse (plan d'origine, distance maximale) limite la réutilisation des tuiles voisines (fromCache).
+        Les tuiles sont demandées par blocs de k x k tuiles voisines, soumis un à un dès qu'un thread se libère:
+        k est réévalué par self.batcher avant chaque bloc, d'après les blocs déjà terminés.
+        Retourne la liste des échecs (clé, fichier, erreur)
+        """
+        work = []
+        pending = []
+        for i in range(len(plan)):
+            missing = []
+            for (survey, fileImage, key) in plan[i]:
+                if keys is not None and key not in keys:
+                    continue
+                if manifest.isDone(key, fileImage):
+                    logging.info("file already imported: %s"%fileImage)
+                else:
+                    missing.append((survey, fileImage, key))
+                    pending.append(key)
+            if len(missing) == 0:
                 continue
-            logging.info("    async request tiles serie %d"%i)
-            result = SkyView.get_images_async(tileCoordinatesCenters[i], survey=channels, pixels=specs["sb_nbPixels"] , radius=tileFov*u.deg)
-            results.append((i,result))
+            work.append((i, missing))
+        manifest.addPending(pending)
 
-        logging.info("=== get fits ===")
-        for (i,result) in results:
+        nbTiles = int(round(np.sqrt(len(tileCoordinatesCenters))))
+        nbWork = len(work)
+        logging.info("=== %d tiles to import with %d workers ==="%(nbWork, self.scheduler.maxWorkers))
+        counters = {"done": 0, "bytes": 0}
+        # --- blocs restant à soumettre, regroupés à nouveau quand k change; blocs soumis, dans l'ordre
+        queued = {"k": None, "blocks": [[t] for t in work]}
+        submitted = []
+        def nextTask():
+            if len(queued["blocks"]) == 0:
+                return None
+            k = self.batcher.size(nbTiles, nbPixels, self.scheduler.maxWorkers)
+            if k != queued["k"]:
+                queued["k"] = k
+                queued["blocks"] = VAT_batching.groupTiles([t for block in queued["blocks"] for t in block], nbTiles, k)
+            block = queued["blocks"].pop(0)
+            submitted.append(block)
+            if len(block) == 1:
+                (i, missing) = block[0]
+                return (self.importTile, (manifest, i, tileCoordinatesCenters[i], missing, nbPixels, tileFov, outputFormat, cancelEvent, reuse))
+            return (self.importBlock, (manifest, block, tileCoordinatesCenters, nbPixels, tileFov, outputFormat, cancelEvent, reuse))
+        def tileDone(k, taskFailures):
+            for (i, missing) in submitted[k]:
+                for (survey, fileImage, key) in missing:
+                    # --- ni les échecs, ni les canaux laissés à faire par une annulation
+                    if manifest.state(key) == VAT_manifest.DONE:
+                        counters["bytes"] += os.path.getsize(fileImage)
+            counters["done"] += len(submitted[k])
+            if progress is not None:
+                progress(counters["done"], nbWork, counters["bytes"])
+        results = self.scheduler.runQueue(nextTask, tileDone, cancelEvent, "tile")
+        failures = [f for taskFailures in results if taskFailures is not None for f in taskFailures]
+        if cancelEvent is not None and cancelEvent.is_set():
+            logging.warning("import cancelled: %d channels of tiles left to import"%len(manifest.keys(VAT_manifest.PENDING)))
+        for (key, fileImage, error) in failures:
+            logging.error("import failed: %s (%s)"%(fileImage, error))
+        return failures
+
+    def importTile(self, manifest, i, tileCoordinatesCenter, missing, nbPixels, tileFov, outputFormat="fits", cancelEvent=None, reuse=None):
+        """
+        télécharger les canaux manquants d'une tuile, avec nouvelles tentatives.
+        Une erreur sur un canal n'interrompt ni les autres canaux ni les autres tuiles.
+        Le cache garde l'image telle que livrée par SkyView, compressée ensuite selon outputFormat.
+        Si cancelEvent est positionné, les tentatives s'arrêtent et les canaux manquants restent à faire.
+        Retourne la liste des échecs définitifs (clé, fichier, erreur)
+        """
+        missing = self.fromCache(manifest, tileCoordinatesCenter, missing, nbPixels, tileFov, outputFormat, reuse)
+        errors = {}
+        cancelled = False
+        for attempt in range(self.scheduler.maxAttempts):
+            if len(missing) == 0:
+                break
+            if cancelEvent is not None and cancelEvent.is_set():
+                cancelled = True
+                break
+            if attempt > 0 and self.scheduler.backoff(attempt - 1, cancelEvent):
+                cancelled = True
+                break
+            logging.info("    request tiles serie %d"%i)
+            surveys = [survey for (survey, fileImage, key) in missing]
+            for (survey, fileImage, key) in missing:
+                manifest.setState(key, VAT_manifest.INFLIGHT, attempts=attempt + 1)
+            try:
+                self.scheduler.throttle(self.skyviewService().URL)
+                # --- soumission du formulaire, rendu des images par le serveur et page de résultats.
+                #     Jamais relue du cache d'astroquery: les liens /tempspace/fits d'une page gardée sont ceux
+                #     qui viennent d'échouer, ou ont été purgés par SkyView avant la reprise d'un import
+                t0 = time.perf_counter()
+                with self.metrics.span("query", tile=i, attempt=attempt + 1):
+                    result = self.skyviewService().get_image_list(tileCoordinatesCenter, survey=surveys, pixels=nbPixels, radius=tileFov*u.deg,
+                                                                  cache=False)
+                latency = time.perf_counter() - t0
+            except ValueError as e:
+                # --- survey inconnu: inutile de recommencer
+                for (survey, fileImage, key) in missing:
+                    errors[key] = str(e)
+                break
+            except Exception as e:
+                logging.warning("request tiles serie %d failed: %s"%(i, e))
+                self.batcher.observe(0., 0., 1, ok=False)
+                for (survey, fileImage, key) in missing:
+                    errors[key] = str(e)
+                    manifest.setState(key, VAT_manifest.PENDING)
+                continue
             logging.info("    get fits serie %d"%i)
+            t0 = time.perf_counter()
+            remaining = []
             for j in range(len(result)):
-                data = result[j].get_fits()
-                fileImage = os.path.splitext(specs["targetSpecsFile"])[0] + '_' + chanames[j] + '_tile_' + str(i) + '.fits'
-                image = data[0]
-                image.writeto(fileImage, overwrite=True, output_verify="ignore")
+                (survey, fileImage, key) = missing[j]
+                try:
+                    self.scheduler.streamToFile(result[j], fileImage)
+                    with self.metrics.span("cache"):
+                        self.cacheTile(survey, tileCoordinatesCenter, nbPixels, tileFov, fileImage, reuse)
+                    self.finishTile(manifest, key, fileImage, outputFormat)
+                    errors.pop(key, None)
+                except Exception as e:
+                    logging.warning("get fits %s failed: %s"%(fileImage, e))
+                    errors[key] = str(e)
+                    manifest.setState(key, VAT_manifest.PENDING)
+                    remaining.append(missing[j])
+            # --- un canal sans réponse du serveur est aussi à refaire
+            for j in range(len(result), len(missing)):
+                errors[missing[j][2]] = "no image returned"
+                remaining.append(missing[j])
+            self.batcher.observe(latency, time.perf_counter() - t0, 1, ok=len(remaining) == 0)
+            missing = remaining
+        failures = []
+        for (survey, fileImage, key) in missing:
+            if cancelled:
+                manifest.setState(key, VAT_manifest.PENDING)
+                continue
+            manifest.setState(key, VAT_manifest.FAILED, error=errors[key])
+            failures.append((key, fileImage, errors[key]))
+        return failures
 
-        logging.info("=== end of import ===")
+    def importBlock(self, manifest, block, tileCoordinatesCenters, nbPixels, tileFov, outputFormat="fits", cancelEvent=None, reuse=None):
+        """
+        télécharger en une requête SkyView l'image d'un bloc de tuiles voisines pour chaque canal,
+        puis la découper en tuiles (VAT_batching). block: liste de (i, canaux manquants).
+        Si la requête du bloc échoue, ses tuiles sont importées une à une, avec nouvelles tentatives.
+        Retourne la liste des échecs définitifs (clé, fichier, erreur)
+        """
+        remaining = []
+        for (i, missing) in block:
+            missing = self.fromCache(manifest, tileCoordinatesCenters[i], missing, nbPixels, tileFov, outputFormat, reuse)
+            if len(missing) > 0:
+                remaining.append((i, missing))
+        indices = [i for (i, missing) in remaining]
+        surveys = []
+        for (i, missing) in remaining:
+            for (survey, fileImage, key) in missing:
+                manifest.setState(key, VAT_manifest.INFLIGHT, attempts=1)
+                if survey not in surveys:
+                    surveys.append(survey)
+        if len(indices) > 1 and not (cancelEvent is not None and cancelEvent.is_set()):
+            blockFile = None
+            try:
+                center, blockPixels, radius = VAT_batching.blockGeometry(tileCoordinatesCenters[indices], tileFov, nbPixels)
+                logging.info("    request block of %d tiles, %d pixels"%(len(indices), blockPixels))
+                self.scheduler.throttle(self.skyviewService().URL)
+                t0 = time.perf_counter()
+                with self.metrics.span("query", tile=indices[0], tiles=len(indices)):
+                    result = self.skyviewService().get_image_list(center, survey=surveys, pixels=blockPixels, radius=radius*u.deg, cache=False)
+                latency = time.perf_counter() - t0
+                if len(result) < len(surveys):
+                    raise IOError("no image returned")
+                t0 = time.perf_counter()
+                for (survey, url) in zip(surveys, result):
+                    tiles = [(i, fileImage, key) for (i, missing) in remaining for (s, fileImage, key) in missing if s == survey]
+                    blockFile = os.path.splitext(tiles[0][1])[0] + '_block.fits'
+                    self.scheduler.streamToFile(url, blockFile)
+                    with self.metrics.span("split", tiles=len(tiles)):
+                        VAT_batching.splitBlock(blockFile, [(tileCoordinatesCenters[i], fileImage) for (i, fileImage, key) in tiles], nbPixels)
+                    os.unlink(blockFile)
+                    blockFile = None
+                    for (i, fileImage, key) in tiles:
+                        with self.metrics.span("cache"):
+                            self.cacheTile(survey, tileCoordinatesCenters[i], nbPixels, tileFov, fileImage, reuse)
+                        self.finishTile(manifest, key, fileImage, outputFormat)
+                self.batcher.observe(latency, time.perf_counter() - t0, len(indices))
+                self.metrics.count("block_tiles", len(indices))
+                return []
+            except Exception as e:
+                logging.warning("request block of %d tiles failed: %s"%(len(indices), e))
+                self.batcher.observe(0., 0., len(indices), ok=False)
+                self.metrics.count("block_fallbacks")
+                if blockFile is not None and os.path.isfile(blockFile):
+                    os.unlink(blockFile)
+        failures = []
+        for (i, missing) in remaining:
+            missing = [(survey, fileImage, key) for (survey, fileImage, key) in missing if not manifest.isDone(key, fileImage)]
+            if len(missing) > 0:
+                failures += self.importTile(manifest, i, tileCoordinatesCenters[i], missing, nbPixels, tileFov, outputFormat, cancelEvent, reuse)
+        return failures
 
+    def fromCache(self, manifest, tileCoordinatesCenter, missing, nbPixels, tileFov, outputFormat, reuse=None):
+        """
+        copier depuis le cache les canaux déjà téléchargés d'une tuile: même centre,
+        sinon la tuile d'un autre plan la plus proche dans la tolérance de self.tileIndex (nearbyTile).
+        Retourne les canaux restant à télécharger
+        """
+        remaining = []
+        for (survey, fileImage, key) in missing:
+            with self.metrics.span("cache"):
+                cached = self.cache.get(self.cache.key(survey, tileCoordinatesCenter, tileFov*u.deg, nbPixels))
+                if cached is None:
+                    cached = self.nearbyTile(survey, tileCoordinatesCenter, nbPixels, tileFov, reuse)
+                if cached is not None:
+                    try:
+                        shutil.copyfile(cached, fileImage)
+                    except FileNotFoundError:
+                        # --- évincé par un autre processus entre la recherche et la copie
+                        cached = None
+            if cached is not None:
+                logging.info("    from cache: %s"%fileImage)
+                self.metrics.count("cache_hits")
+                self.finishTile(manifest, key, fileImage, outputFormat)
+            else:
+                remaining.append((survey, fileImage, key))
+        return remaining
+
+    def nearbyTile(self, survey, tileCoordinatesCenter, nbPixels, tileFov, reuse=None):
+        """
+        fichier du cache de la tuile déjà téléchargée la plus proche, dans la tolérance, ou None.
+        reuse (plan d'origine, distance maximale): les tuiles du plan en cours ne sont jamais réutilisées,
+        deux tuiles voisines du plan recevraient sinon la même copie
+        """
+        origin, maxDistance = reuse if reuse is not None else (None, None)
+        center = tileCoordinatesCenter.icrs
+        cacheKey, distance = self.tileIndex.nearest(survey, tileFov, nbPixels, center.ra.degree, center.dec.degree, maxDistance, origin)
+        if cacheKey is None:
+            return None
+        cached = self.cache.get(cacheKey)
+        if cached is None:
+            # --- tuile sortie du cache (éviction, durée de vie)
+            self.tileIndex.remove(survey, tileFov, nbPixels, cacheKey)
+            return None
+        logging.info("    reuse tile at %.1f arcsec: %s"%(distance*3600., cached))
+        self.metrics.count("tiles_reused")
+        return cached
+
+    def cacheTile(self, survey, tileCoordinatesCenter, nbPixels, tileFov, fileImage, reuse=None):
+        """
+        copier une tuile téléchargée dans le cache et l'ajouter à l'index spatial, avec son plan d'origine
+        """
+        cacheKey = self.cache.key(survey, tileCoordinatesCenter, tileFov*u.deg, nbPixels)
+        self.cache.put(cacheKey, fileImage)
+        center = tileCoordinatesCenter.icrs
+        self.tileIndex.add(survey, tileFov, nbPixels, center.ra.degree, center.dec.degree, cacheKey, reuse[0] if reuse is not None else None)
+
+    def discardTile(self, survey, tileCoordinatesCenter, nbPixels, tileFov, reuse=None):
+        """
+        retirer du cache et de l'index la tuile de ce centre et celle qui la remplacerait (nearbyTile)
+        """
+        origin, maxDistance = reuse if reuse is not None else (None, None)
+        self.cache.discard(self.cache.key(survey, tileCoordinatesCenter, tileFov*u.deg, nbPixels))
+        center = tileCoordinatesCenter.icrs
+        cacheKey, distance = self.tileIndex.nearest(survey, tileFov, nbPixels, center.ra.degree, center.dec.degree, maxDistance, origin)
+        if cacheKey is not None:
+            self.cache.discard(cacheKey)
+            self.tileIndex.remove(survey, tileFov, nbPixels, cacheKey)
+
+    def finishTile(self, manifest, key, fileImage, outputFormat):
+        """
+        compression, statistiques et enregistrement dans le manifeste d'un canal téléchargé
+        """
+        with self.metrics.span("compress", file=os.path.basename(fileImage)):
+            VAT_fits.compressFits(fileImage, outputFormat)
+        with self.metrics.span("stats", file=os.path.basename(fileImage)):
+            stats = VAT_stats.fileStats(fileImage)
+        with self.metrics.span("manifest"):
+            manifest.markDone(key, fileImage, stats=stats)
+
+    def mosaicFits(self, jsonSpecs, nbTiles, cover, processes=None):
+        """
+        assembler les tuiles importées en une image par canal: <specs>_<canal>_mosaic.fits.
+        cover est le recouvrement retourné par calculateNbTiles,
+        processes le nombre de processus de calcul (par défaut, un par cœur)
+        """
+        logging.info("mosaicFits")
+        specs = json.loads(jsonSpecs)
+        channels, chanames = specsChannels(specs)
+        base = os.path.splitext(specs["targetSpecsFile"])[0]
+        mosaics = []
+        for chaname in chanames:
+            tileFiles = [base + '_' + chaname + '_tile_' + str(i) + '.fits' for i in range(nbTiles*nbTiles)]
+            tileFiles = [f for f in tileFiles if os.path.isfile(f)]
+            if len(tileFiles) < nbTiles*nbTiles:
+                logging.warning("mosaic %s: %d tiles missing"%(chaname, nbTiles*nbTiles - len(tileFiles)))
+            if len(tileFiles) == 0:
+                continue
+            with self.metrics.span("mosaic", channel=chaname):
+                mosaics.append(VAT_mosaic.buildMosaic(tileFiles, base + '_' + chaname + '_mosaic.fits', cover, processes=processes))
+        return mosaics
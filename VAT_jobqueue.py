@@ -0,0 +1,82 @@
+import os
+import logging
+import json
+import threading
+
+import VAT_manifest
+
+
+class JobQueue:
+    """
+    file d'attente persistante des cibles à importer: (fichier de spécifications, état, priorité).
+    Les états sont ceux du manifeste (pending, in-flight, done, failed)
+    """
+
+    def __init__(self, queueFile):
+        self.fileName = queueFile
+        self.lock = threading.Lock()
+        self.jobs = []
+        if os.path.isfile(queueFile):
+            with open(queueFile, encoding="utf-8") as f:
+                self.jobs = json.load(f)
+            # --- une cible interrompue est reprise, son manifeste évite de tout retélécharger
+            for job in self.jobs:
+                if job["state"] == VAT_manifest.INFLIGHT:
+                    job["state"] = VAT_manifest.PENDING
+        logging.info("JobQueue %s: %d jobs"%(queueFile, len(self.jobs)))
+
+    def save(self):
+        VAT_manifest.atomicJsonDump(self.jobs, self.fileName)
+
+    def find(self, specsFile):
+        for job in self.jobs:
+            if job["specsFile"] == specsFile:
+                return job
+        return None
+
+    def add(self, specsFile, priority=0):
+        """
+        ajouter une cible, ou la remettre en attente avec une nouvelle priorité
+        """
+        specsFile = os.path.abspath(specsFile)
+        with self.lock:
+            job = self.find(specsFile)
+            if job is None:
+                job = {"specsFile": specsFile}
+                self.jobs.append(job)
+            job["priority"] = priority
+            job["state"] = VAT_manifest.PENDING
+            job.pop("error", None)
+            self.save()
+
+    def next(self):
+        """
+        la cible en attente de plus haute priorité (à priorité égale, la plus ancienne),
+        marquée en cours. None si la file est vide
+        """
+        with self.lock:
+            pending = [job for job in self.jobs if job["state"] == VAT_manifest.PENDING]
+            if len(pending) == 0:
+                return None
+            job = max(pending, key=lambda job: job["priority"])
+            job["state"] = VAT_manifest.INFLIGHT
+            self.save()
+            return job["specsFile"]
+
+    def finish(self, specsFile, error=None):
+        with self.lock:
+            job = self.find(specsFile)
+            if error is None:
+                job["state"] = VAT_manifest.DONE
+                job.pop("error", None)
+            else:
+                job["state"] = VAT_manifest.FAILED
+                job["error"] = error
+            self.save()
+
+    def counts(self):
+        with self.lock:
+            res = {}
+            for job in self.jobs:
+                res[job["state"]] = res.get(job["state"], 0) + 1
+            return res
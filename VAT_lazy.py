@@ -0,0 +1,37 @@
+import importlib
+import threading
+
+_lock = threading.RLock()
+
+
+class LazyModule:
+    """
+    module importé à la première lecture d'un de ses attributs.
+    astroquery, astropy et matplotlib coûtent plusieurs secondes au démarrage:
+    un traitement qui n'en a pas besoin (calcul des tuiles, file d'attente) ne les charge pas.
+    onLoad(module) est appelé une fois, juste après l'import
+    """
+
+    def __init__(self, name, onLoad=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_onLoad"] = onLoad
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            # --- importlib garantit qu'un module n'est exécuté qu'une fois, même entre threads
+            module = importlib.import_module(self._name)
+            with _lock:
+                if self._module is None:
+                    if self._onLoad is not None:
+                        self._onLoad(module)
+                    self.__dict__["_module"] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return "<lazy module %s%s>"%(self._name, "" if self._module is None else " (loaded)")
+
+
+def module(name, onLoad=None):
+    return LazyModule(name, onLoad)
@@ -0,0 +1,185 @@
+import os
+import contextlib
+import logging
+import json
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # --- Windows: pas de verrou entre processus, seulement entre threads
+    fcntl = None
+
+PENDING = "pending"
+INFLIGHT = "in-flight"
+DONE = "done"
+FAILED = "failed"
+
+
+def fileChecksum(fileName, chunkSize=1 << 20):
+    """
+    sha256 d'un fichier, lu par blocs
+    """
+    h = hashlib.sha256()
+    with open(fileName, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkSize), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def atomicJsonDump(obj, fileName):
+    """
+    écriture atomique: fichier temporaire dans le même répertoire puis renommage
+    """
+    directory = os.path.dirname(os.path.abspath(fileName))
+    fd, tmpName = tempfile.mkstemp(dir=directory, prefix=".%s_"%os.path.basename(fileName), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding="utf-8") as f:
+            json.dump(obj, f, sort_keys=True, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpName, fileName)
+    except BaseException:
+        os.unlink(tmpName)
+        raise
+
+
+@contextlib.contextmanager
+def fileLock(fileName):
+    """
+    verrou exclusif entre processus (fcntl.flock sur fileName + '.lock'),
+    par exemple autour de la relecture et de la réécriture d'un index partagé par plusieurs VAT_batch
+    """
+    with open(fileName + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def applyState(entry, state, fields):
+    entry["state"] = state
+    if state != FAILED:
+        entry.pop("error", None)
+    if state == DONE:
+        entry.pop("quality", None)
+    entry.update(fields)
+
+
+class JobManifest:
+    """
+    état persistant de chaque (tuile, canal) d'un import,
+    enregistré à côté du fichier de spécifications de la cible.
+    L'état est gardé en mémoire: chaque changement est ajouté en une ligne au journal <cible>_manifest.journal,
+    fusionné dans le manifeste par une écriture atomique à la fin de chaque passe (compact).
+    Les passages en cours (in-flight) ne sont pas journalisés: ils redeviennent à faire au chargement
+    """
+
+    def __init__(self, targetSpecsFile):
+        base = os.path.splitext(targetSpecsFile)[0]
+        self.fileName = base + '_manifest.json'
+        self.journalName = base + '_manifest.journal'
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.journal = None
+        self.load()
+
+    @staticmethod
+    def key(tile, chaname):
+        return "%s_tile_%d"%(chaname, tile)
+
+    def load(self):
+        if os.path.isfile(self.fileName):
+            with open(self.fileName, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        replayed = 0
+        if os.path.isfile(self.journalName):
+            with open(self.journalName, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # --- dernière ligne incomplète d'un import interrompu
+                        break
+                    for key in record["keys"]:
+                        applyState(self.entries.setdefault(key, {}), record["state"], record.get("fields", {}))
+                    replayed += 1
+        # --- un import interrompu laisse des entrées en cours: elles sont à refaire
+        for entry in self.entries.values():
+            if entry["state"] == INFLIGHT:
+                entry["state"] = PENDING
+        if len(self.entries) > 0:
+            logging.info("manifest loaded: %s (%d entries, %d journal records)"%(self.fileName, len(self.entries), replayed))
+        if replayed > 0:
+            self.compact()
+
+    def save(self):
+        with self.lock:
+            atomicJsonDump(self.entries, self.fileName)
+
+    def record(self, keys, state, fields):
+        """
+        ajoute un changement d'état au journal, sans réécrire le manifeste
+        """
+        if self.journal is None:
+            self.journal = open(self.journalName, 'a', encoding="utf-8")
+        self.journal.write(json.dumps({"keys": keys, "state": state, "fields": fields}) + "\n")
+        self.journal.flush()
+
+    def compact(self):
+        """
+        écriture atomique du manifeste complet, puis suppression du journal
+        """
+        with self.lock:
+            self.save()
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if os.path.isfile(self.journalName):
+                os.unlink(self.journalName)
+
+    def state(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return PENDING if entry is None else entry["state"]
+
+    def isDone(self, key, fileImage):
+        """
+        la tuile est terminée si le manifeste le dit et que le fichier a la bonne taille
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry["state"] != DONE:
+                return False
+            return os.path.isfile(fileImage) and os.path.getsize(fileImage) == entry["size"]
+
+    def setState(self, key, state, **fields):
+        with self.lock:
+            applyState(self.entries.setdefault(key, {}), state, fields)
+            if state != INFLIGHT:
+                self.record([key], state, fields)
+
+    def addPending(self, keys):
+        """
+        enregistrer en une seule ligne du journal les (tuile, canal) à télécharger
+        """
+        with self.lock:
+            for key in keys:
+                applyState(self.entries.setdefault(key, {}), PENDING, {})
+            self.record(list(keys), PENDING, {})
+
+    def markDone(self, key, fileImage, **fields):
+        self.setState(key, DONE,
+                      file=os.path.basename(fileImage),
+                      size=os.path.getsize(fileImage),
+                      sha256=fileChecksum(fileImage),
+                      **fields)
+
+    def keys(self, state):
+        with self.lock:
+            return [k for k, entry in self.entries.items() if entry["state"] == state]
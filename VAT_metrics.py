@@ -0,0 +1,198 @@
+import os
+import logging
+import json
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# --- bornes supérieures (secondes) des classes des histogrammes de durée
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 25., 60., 120., 300.)
+
+
+class Histogram:
+    """
+    histogramme cumulatif des durées d'une étape, au sens de Prometheus
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def add(self, value):
+        self.counts[int(np.searchsorted(self.buckets, value))] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        estimation d'un quantile: borne supérieure de la classe qui le contient, au plus le maximum observé
+        """
+        if self.count == 0:
+            return np.nan
+        rank = q*self.count
+        total = 0
+        for k, n in enumerate(self.counts):
+            total += n
+            if total >= rank:
+                return min(self.buckets[k], self.max) if k < len(self.buckets) else self.max
+        return self.max
+
+
+class Metrics:
+    """
+    mesures structurées d'un import: durée de chaque étape (span), compteurs (octets, requêtes, erreurs)
+    et nombre de tâches actives en même temps.
+    Avec eventsFile, chaque span est ajouté au fichier en JSON lines dès sa fin.
+    Partagé entre les threads de téléchargement
+    """
+
+    def __init__(self, eventsFile=None, buckets=BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.active = {}
+        self.maxActive = {}
+        self.events = None
+        if eventsFile is not None:
+            self.events = open(eventsFile, 'a', encoding="utf-8", buffering=1)
+        self.t0 = time.time()
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """
+        mesure la durée du bloc; une exception est comptée comme une erreur de l'étape
+        """
+        start = time.time()
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if error is not None:
+                labels["error"] = error
+                self.count("%s_errors"%stage)
+            self.record(stage, time.perf_counter() - t0, start, **labels)
+
+    def record(self, stage, duration, start=None, **labels):
+        """
+        ajoute une durée mesurée à part (par exemple cumulée sur plusieurs blocs)
+        """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self.histograms[stage] = histogram
+            histogram.add(duration)
+            if self.events is not None:
+                event = {"stage": stage, "start": start if start is not None else time.time() - duration,
+                         "duration": duration, "thread": threading.current_thread().name}
+                event.update(labels)
+                self.events.write(json.dumps(event, default=str) + "\n")
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def inUse(self, name):
+        """
+        compte les exécutions simultanées du bloc, et leur maximum
+        """
+        with self.lock:
+            self.active[name] = self.active.get(name, 0) + 1
+            self.maxActive[name] = max(self.maxActive.get(name, 0), self.active[name])
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active[name] -= 1
+
+    def summary(self):
+        """
+        durées par étape (nombre, total, moyenne, p50, p95, max), compteurs et concurrence
+        """
+        with self.lock:
+            stages = {}
+            for stage, h in self.histograms.items():
+                stages[stage] = {"count": h.count,
+                                 "seconds": h.sum,
+                                 "mean": h.sum/h.count,
+                                 "p50": h.quantile(0.5),
+                                 "p95": h.quantile(0.95),
+                                 "max": h.max}
+            return {"wallSeconds": time.time() - self.t0,
+                    "stages": stages,
+                    "counters": dict(self.counters),
+                    "active": dict(self.active),
+                    "maxActive": dict(self.maxActive)}
+
+    def logSummary(self):
+        summary = self.summary()
+        logging.info("=== metrics: %.1f s wall clock ==="%summary["wallSeconds"])
+        for stage, s in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            logging.info("    %-10s %6d x  total %8.2f s  mean %7.3f s  p95 %7.3f s  max %7.3f s"
+                         %(stage, s["count"], s["seconds"], s["mean"], s["p95"], s["max"]))
+        for name, value in sorted(summary["counters"].items()):
+            logging.info("    %-20s %d"%(name, value))
+        for name, value in sorted(summary["maxActive"].items()):
+            logging.info("    max %s in use: %d"%(name, value))
+
+    def writeSummary(self):
+        """
+        ajoute le résumé à la fin du fichier d'événements
+        """
+        if self.events is not None:
+            line = json.dumps({"summary": self.summary()}) + "\n"
+            with self.lock:
+                self.events.write(line)
+
+    def prometheus(self):
+        """
+        exposition au format texte de Prometheus
+        """
+        lines = []
+        with self.lock:
+            lines.append("# HELP vat_stage_seconds duration of the import stages")
+            lines.append("# TYPE vat_stage_seconds histogram")
+            for stage, h in sorted(self.histograms.items()):
+                total = 0
+                for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    total += n
+                    lines.append('vat_stage_seconds_bucket{stage="%s",le="%s"} %d'%(stage, bound, total))
+                lines.append('vat_stage_seconds_sum{stage="%s"} %.6f'%(stage, h.sum))
+                lines.append('vat_stage_seconds_count{stage="%s"} %d'%(stage, h.count))
+            for name, value in sorted(self.counters.items()):
+                lines.append("# TYPE vat_%s_total counter"%name)
+                lines.append("vat_%s_total %s"%(name, value))
+            for name in sorted(self.maxActive):
+                lines.append("# TYPE vat_%s_active gauge"%name)
+                lines.append("vat_%s_active %d"%(name, self.active[name]))
+                lines.append("# TYPE vat_%s_active_max gauge"%name)
+                lines.append("vat_%s_active_max %d"%(name, self.maxActive[name]))
+        return "\n".join(lines) + "\n"
+
+    def writePrometheus(self, fileName):
+        """
+        écriture atomique, pour le textfile collector de node_exporter
+        """
+        directory = os.path.dirname(os.path.abspath(fileName))
+        fd, tmpName = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmpName, fileName)
+
+    def close(self):
+        if self.events is not None:
+            self.events.close()
+            self.events = None
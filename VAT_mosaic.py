@@ -0,0 +1,232 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
+
+import VAT_fits
+
+
+class TileInfo:
+    """
+    une tuile téléchargée: fichier, WCS et emprise dans l'image de sortie
+    """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        with fits.open(fileName) as hdul:
+            header = VAT_fits.imageHDU(hdul).header
+        self.wcs = WCS(header).celestial
+        self.shape = (header["NAXIS2"], header["NAXIS1"])
+        self.bbox = None
+
+
+def tileCorners(tile):
+    """
+    coordonnées du monde des bords de la tuile (coins et milieux des côtés)
+    """
+    ny, nx = tile.shape
+    x = np.array([-0.5, nx/2., nx - 0.5, nx - 0.5, nx - 0.5, nx/2., -0.5, -0.5])
+    y = np.array([-0.5, -0.5, -0.5, ny/2., ny - 0.5, ny - 0.5, ny - 0.5, ny/2.])
+    return tile.wcs.pixel_to_world_values(x, y)
+
+
+def outputWCS(tiles):
+    """
+    projection TAN de la mosaïque: centrée sur la moyenne des centres des tuiles,
+    au pas de la tuile la plus fine, et englobant toutes les tuiles.
+    Retourne le WCS et la taille (ny, nx) de l'image de sortie
+    """
+    vectors = []
+    scale = np.inf
+    for tile in tiles:
+        ny, nx = tile.shape
+        lon, lat = np.radians(tile.wcs.pixel_to_world_values((nx - 1)/2., (ny - 1)/2.))
+        vectors.append([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+        scale = min(scale, proj_plane_pixel_scales(tile.wcs).min())
+    v = np.mean(vectors, axis=0)
+    wcs0 = tiles[0].wcs
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = [name.split('-')[0].ljust(4, '-') + '-TAN' for name in wcs0.wcs.ctype]
+    wcs.wcs.crval = [np.degrees(np.arctan2(v[1], v[0])) % 360., np.degrees(np.arctan2(v[2], np.hypot(v[0], v[1])))]
+    wcs.wcs.cdelt = [-scale, scale]
+    wcs.wcs.crpix = [1., 1.]
+    if wcs0.wcs.radesys:
+        wcs.wcs.radesys = wcs0.wcs.radesys
+    if np.isfinite(wcs0.wcs.equinox):
+        wcs.wcs.equinox = wcs0.wcs.equinox
+    xs = []
+    ys = []
+    for tile in tiles:
+        x, y = wcs.world_to_pixel_values(*tileCorners(tile))
+        xs.append(x)
+        ys.append(y)
+    xmin = np.floor(np.min(xs))
+    ymin = np.floor(np.min(ys))
+    nx = int(np.ceil(np.max(xs)) - xmin) + 1
+    ny = int(np.ceil(np.max(ys)) - ymin) + 1
+    wcs.wcs.crpix = [1. - xmin, 1. - ymin]
+    for tile, x, y in zip(tiles, xs, ys):
+        x = x - xmin
+        y = y - ymin
+        tile.bbox = (max(0, int(np.floor(np.min(y)))), min(ny, int(np.ceil(np.max(y))) + 1),
+                     max(0, int(np.floor(np.min(x)))), min(nx, int(np.ceil(np.max(x))) + 1))
+    return wcs, (ny, nx)
+
+
+def createOutput(fileName, wcs, shape):
+    """
+    crée le fichier fits de sortie sans l'écrire en mémoire (float32, gros boutien)
+    et retourne la position des données dans le fichier
+    """
+    ny, nx = shape
+    header = fits.Header()
+    header["SIMPLE"] = True
+    header["BITPIX"] = -32
+    header["NAXIS"] = 2
+    header["NAXIS1"] = nx
+    header["NAXIS2"] = ny
+    header.extend(wcs.to_header())
+    header["HISTORY"] = "VAT mosaic"
+    headerBytes = header.tostring().encode("ascii")
+    dataBytes = nx*ny*4
+    padding = (-dataBytes) % 2880
+    with open(fileName, 'wb') as f:
+        f.write(headerBytes)
+        f.seek(len(headerBytes) + dataBytes + padding - 1)
+        f.write(b'\0')
+    return len(headerBytes)
+
+
+def openOutput(fileName, offset, shape):
+    return np.memmap(fileName, dtype='>f4', mode='r+', offset=offset, shape=shape)
+
+
+def featherWeights(n, band):
+    """
+    poids le long d'un axe de la tuile: rampe linéaire sur la bande de recouvrement, 1 au centre
+    """
+    d = np.minimum(np.arange(n) + 0.5, n - 0.5 - np.arange(n))
+    if band <= 0:
+        return np.ones(n)
+    return np.clip(d/band, 1.e-3, 1.)
+
+
+def sampleTile(data, x, y):
+    """
+    interpolation bilinéaire de data aux positions (x, y), NaN hors de l'image
+    """
+    ny, nx = data.shape
+    valid = (x >= 0) & (x <= nx - 1) & (y >= 0) & (y <= ny - 1)
+    x = np.where(valid, x, 0.)
+    y = np.where(valid, y, 0.)
+    x0 = np.minimum(np.floor(x).astype(np.int64), max(0, nx - 2))
+    y0 = np.minimum(np.floor(y).astype(np.int64), max(0, ny - 2))
+    x1 = np.minimum(x0 + 1, nx - 1)
+    y1 = np.minimum(y0 + 1, ny - 1)
+    fx = x - x0
+    fy = y - y0
+    v = ((1. - fx)*(1. - fy)*data[y0, x0] + fx*(1. - fy)*data[y0, x1]
+         + (1. - fx)*fy*data[y1, x0] + fx*fy*data[y1, x1])
+    return np.where(valid, v, np.nan)
+
+
+def addTile(tile, wcs, r0, r1, cover, total, weights):
+    """
+    reprojette la partie de la tuile qui tombe dans la bande [r0, r1) de la sortie
+    et l'ajoute, pondérée, aux sommes de la bande
+    """
+    b0, b1, c0, c1 = tile.bbox
+    rows = slice(max(r0, b0), min(r1, b1))
+    if rows.stop <= rows.start:
+        return
+    xx, yy = np.meshgrid(np.arange(c0, c1), np.arange(rows.start, rows.stop))
+    x, y = tile.wcs.world_to_pixel_values(*wcs.pixel_to_world_values(xx, yy))
+    ny, nx = tile.shape
+    inside = (x >= -0.5) & (x <= nx - 0.5) & (y >= -0.5) & (y <= ny - 0.5)
+    if not inside.any():
+        return
+    # --- seules les lignes de la tuile utiles à cette bande sont lues
+    ya = max(0, int(np.floor(y[inside].min())))
+    yb = min(ny, int(np.ceil(y[inside].max())) + 1)
+    with fits.open(tile.fileName, memmap=True, do_not_scale_image_data=True) as hdul:
+        data = VAT_fits.readRows(VAT_fits.imageHDU(hdul), ya, yb)
+    v = sampleTile(data, np.clip(x, 0, nx - 1), np.clip(y, 0, ny - 1) - ya)
+    wx = featherWeights(nx, cover/100.*nx)
+    wy = featherWeights(ny, cover/100.*ny)
+    w = wx[np.clip(np.round(x).astype(np.int64), 0, nx - 1)]*wy[np.clip(np.round(y).astype(np.int64), 0, ny - 1)]
+    good = inside & np.isfinite(v)
+    w = np.where(good, w, 0.)
+    total[rows.start - r0:rows.stop - r0, c0:c1] += w*np.where(good, v, 0.)
+    weights[rows.start - r0:rows.stop - r0, c0:c1] += w
+
+
+# --- état de chaque processus de calcul, initialisé une fois par initStrips
+strips = {}
+
+
+def initStrips(tiles, wcs, cover, outputFile, offset, shape):
+    strips["tiles"] = tiles
+    strips["wcs"] = wcs
+    strips["cover"] = cover
+    strips["out"] = openOutput(outputFile, offset, shape)
+
+
+def buildStrip(r0, r1):
+    """
+    calcule les lignes [r0, r1) de la mosaïque et les écrit directement dans le memmap de sortie:
+    seules les bornes de la bande transitent entre processus
+    """
+    nx = strips["out"].shape[1]
+    total = np.zeros((r1 - r0, nx))
+    weights = np.zeros((r1 - r0, nx))
+    for tile in strips["tiles"]:
+        addTile(tile, strips["wcs"], r0, r1, strips["cover"], total, weights)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        strips["out"][r0:r1] = np.where(weights > 0, total/weights, np.nan)
+    return r0, r1
+
+
+def buildMosaic(tileFiles, outputFile, cover, maxStripBytes=256*1024**2, processes=None):
+    """
+    reprojette et co-additionne les tuiles dans une seule image fits.
+    La sortie est découpée en bandes de lignes indépendantes, calculées par un pool de processus
+    qui écrivent chacun dans un memmap du fichier de sortie:
+    la mémoire utilisée ne dépend pas de la taille de la mosaïque.
+    Dans les recouvrements, chaque tuile est pondérée par une rampe sur la largeur
+    du recouvrement (cover en %, calculé par calculateNbTiles)
+    """
+    if processes is None:
+        processes = os.cpu_count()
+    logging.info("buildMosaic %s: %d tiles, %d processes"%(outputFile, len(tileFiles), processes))
+    tiles = [TileInfo(fileName) for fileName in tileFiles]
+    wcs, shape = outputWCS(tiles)
+    ny, nx = shape
+    logging.info("mosaic size: %d x %d"%(nx, ny))
+    offset = createOutput(outputFile, wcs, shape)
+    # --- bandes limitées en mémoire par processus, et assez nombreuses pour équilibrer la charge
+    stripRows = max(1, min(maxStripBytes//(processes*nx*8*4), int(np.ceil(ny/(4.*processes)))))
+    bounds = [(r0, min(ny, r0 + stripRows)) for r0 in range(0, ny, stripRows)]
+    initArgs = (tiles, wcs, cover, outputFile, offset, shape)
+    if processes == 1:
+        initStrips(*initArgs)
+        for r0, r1 in bounds:
+            buildStrip(r0, r1)
+            logging.info("    mosaic rows %d-%d / %d"%(r0, r1, ny))
+        strips["out"].flush()
+        strips.clear()
+        return outputFile
+    # --- pas de fork: le processus appelant a des threads de téléchargement qui peuvent tenir des verrous
+    context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=initStrips, initargs=initArgs) as pool:
+        futures = [pool.submit(buildStrip, r0, r1) for r0, r1 in bounds]
+        for future in as_completed(futures):
+            r0, r1 = future.result()
+            logging.info("    mosaic rows %d-%d / %d"%(r0, r1, ny))
+    return outputFile
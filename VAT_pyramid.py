@@ -0,0 +1,231 @@
+import os
+import logging
+import hashlib
+import shutil
+import time
+import warnings
+
+import numpy as np
+
+from astropy.io import fits
+
+import VAT_cache
+import VAT_fits
+
+
+class SectionData:
+    """
+    image brute d'un HDU lue à la demande par bandes, par hdu.section: seules les tuiles de compression
+    des lignes demandées sont décompressées, alors que hdu.data d'un CompImageHDU décompresse l'image entière.
+    Le fichier doit être ouvert avec do_not_scale_image_data
+    """
+
+    def __init__(self, hdu):
+        self.section = hdu.section
+        self.shape = tuple(hdu.shape)
+        self.itemsize = abs(hdu.header["BITPIX"])//8
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        index = index + (slice(None),)*(len(self.shape) - len(index))
+        ranges = [sl.indices(n) for (sl, n) in zip(index, self.shape)]
+        # --- bande contiguë lue par section, le pas éventuel est appliqué ensuite
+        block = np.asarray(self.section[tuple(slice(start, max(start, stop)) for (start, stop, step) in ranges)])
+        return block[tuple(slice(None, None, step) for (start, stop, step) in ranges)]
+
+
+class ImagePyramid:
+    """
+    pyramide multi-résolution d'une image, stockée sur disque.
+    Le niveau 0 est l'image elle-même (souvent un memmap du fichier fits, ou SectionData pour un fits compressé),
+    le niveau k a un pixel pour 2^k x 2^k pixels de l'image: moyenne des blocs (binning)
+    ou un pixel sur 2^k (décimation, qui ne lit qu'une partie du fichier).
+    Chaque niveau est construit à la première demande puis relu en memmap (level_k.npy).
+    Les pixels d'une image d'entiers égaux à blank (mot clé BLANK) deviennent NaN dans tous les niveaux.
+    hdul est le fichier fits ouvert dont data est l'image, refermé par close
+    """
+
+    def __init__(self, data, directory, binning=True, scale=(1., 0.), minSize=256, cache=None, hdul=None, blank=None):
+        self.data = data
+        self.directory = directory
+        self.cache = cache
+        self.hdul = hdul
+        self.binning = binning
+        self.scale = scale
+        self.blank = blank
+        self.shape = data.shape
+        self.levels = {0: data}
+        self.nbLevels = 1
+        while max(self.shape)/2**self.nbLevels >= minSize:
+            self.nbLevels += 1
+        os.makedirs(directory, exist_ok=True)
+
+    def level(self, k):
+        if k in self.levels:
+            return self.levels[k]
+        fileName = os.path.join(self.directory, "level_%d.npy"%k)
+        if not os.path.isfile(fileName):
+            self.buildLevel(k, fileName)
+        self.levels[k] = np.load(fileName, mmap_mode='r')
+        return self.levels[k]
+
+    def masked(self, raw, k):
+        """
+        valeurs brutes d'un bloc du niveau k en réels, BLANK remplacé par NaN:
+        seul le niveau 0 porte encore BLANK, les autres sont construits masqués
+        """
+        values = np.asarray(raw, dtype=np.float32)
+        if k == 0 and self.blank is not None:
+            values[np.asarray(raw) == self.blank] = np.nan
+        return values
+
+    def physical(self, raw, k):
+        """
+        valeurs physiques (BSCALE/BZERO) d'un bloc du niveau k
+        """
+        return self.masked(raw, k)*self.scale[0] + self.scale[1]
+
+    def buildLevel(self, k, fileName):
+        """
+        construit un niveau par bandes de lignes, sans charger l'image entière
+        """
+        logging.info("ImagePyramid build level %d: %s"%(k, fileName))
+        if self.binning:
+            source = self.level(k - 1)
+            step = 2
+        else:
+            source = self.data
+            step = 2**k
+        ny = source.shape[0]//step if self.binning else (source.shape[0] + step - 1)//step
+        nx = source.shape[1]//step if self.binning else (source.shape[1] + step - 1)//step
+        tmpName = fileName + ".tmp.npy"
+        out = np.lib.format.open_memmap(tmpName, mode='w+', dtype=np.float32, shape=(ny, nx))
+        rows = max(1, (1 << 24)//(step*source.shape[1]*source.itemsize))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # --- blocs entièrement NaN
+            for r in range(0, ny, rows):
+                r1 = min(ny, r + rows)
+                if self.binning:
+                    band = self.masked(source[r*step:r1*step, :nx*step], k - 1)
+                    out[r:r1] = np.nanmean(band.reshape(r1 - r, step, nx, step), axis=(1, 3))
+                else:
+                    out[r:r1] = self.masked(source[r*step:r1*step:step, ::step], 0)
+        out.flush()
+        del out
+        os.replace(tmpName, fileName)
+        if self.cache is not None:
+            self.cache.evict(self.directory)
+
+    def close(self):
+        """
+        referme le fichier fits et les memmap des niveaux
+        """
+        self.levels = {}
+        self.data = None
+        if self.hdul is not None:
+            self.hdul.close()
+            self.hdul = None
+
+    def levelFor(self, imagePixelsPerScreenPixel):
+        """
+        niveau le plus grossier qui garde au moins un pixel par pixel écran
+        """
+        k = int(np.floor(np.log2(max(1., imagePixelsPerScreenPixel))))
+        return min(k, self.nbLevels - 1)
+
+    def read(self, k, x0, x1, y0, y1):
+        """
+        bloc du niveau k couvrant la zone [x0, x1] x [y0, y1] (pixels de l'image pleine résolution).
+        Retourne le bloc et son extent dans le repère pleine résolution, ou (None, None)
+        """
+        s = 2**k
+        offset = 0.5 if (self.binning or k == 0) else s/2.
+        level = self.level(k)
+        i0 = max(0, int(np.floor((y0 + offset)/s)))
+        i1 = min(level.shape[0], int(np.ceil((y1 + offset)/s)) + 1)
+        j0 = max(0, int(np.floor((x0 + offset)/s)))
+        j1 = min(level.shape[1], int(np.ceil((x1 + offset)/s)) + 1)
+        if i1 <= i0 or j1 <= j0:
+            return None, None
+        block = self.physical(level[i0:i1, j0:j1], k)
+        extent = (j0*s - offset, j1*s - offset, i0*s - offset, i1*s - offset)
+        return block, extent
+
+
+class PyramidCache:
+    """
+    répertoires des niveaux des pyramides ($VAT_CACHE_DIR/pyramids/<clé>), avec éviction LRU sur la taille totale.
+    La date de modification d'un répertoire est celle de sa dernière utilisation
+    """
+
+    def __init__(self, directory=None, maxBytes=1024**3):
+        if directory is None:
+            directory = os.path.join(VAT_cache.defaultCacheDir(), "pyramids")
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def path(self, key):
+        """
+        répertoire d'une pyramide, marqué comme utilisé maintenant
+        """
+        directory = os.path.join(self.directory, key)
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        os.utime(directory, (now, now))
+        return directory
+
+    def evict(self, keep=None):
+        """
+        supprimer les pyramides les moins récemment utilisées jusqu'à repasser sous maxBytes, sauf keep
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total += size
+        for (mtime, size, path) in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            logging.info("pyramid cache eviction: %s"%path)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def pyramidForHDU(hdu, cache=None):
+    """
+    pyramide (moyennée) d'une image en mémoire, par exemple l'aperçu SkyView
+    """
+    if cache is None:
+        cache = PyramidCache()
+    data = np.ascontiguousarray(hdu.data)
+    h = hashlib.sha256(hdu.header.tostring().encode("utf-8"))
+    h.update(data)
+    return ImagePyramid(data, cache.path(h.hexdigest()), cache=cache)
+
+
+def pyramidForFile(imageFile, binning=False, cache=None):
+    """
+    pyramide d'un fichier fits ouvert une seule fois en memmap, gardé ouvert jusqu'à pyramid.close().
+    Une image compressée est lue par bandes de lignes (SectionData), jamais décompressée entièrement.
+    Retourne le header et la pyramide
+    """
+    if cache is None:
+        cache = PyramidCache()
+    hdul = fits.open(imageFile, memmap=True, do_not_scale_image_data=True)
+    hdu = VAT_fits.imageHDU(hdul)
+    header = hdu.header
+    st = os.stat(imageFile)
+    # --- "blank": les niveaux construits avant le masquage de BLANK ne sont pas réutilisés
+    key = "%s:%d:%d:%s:blank"%(os.path.abspath(imageFile), st.st_size, st.st_mtime_ns, binning)
+    scale = (header.get('BSCALE', 1.), header.get('BZERO', 0.))
+    blank = header.get('BLANK') if header.get('BITPIX', 0) > 0 else None
+    data = SectionData(hdu) if isinstance(hdu, fits.CompImageHDU) else hdu.data
+    pyramid = ImagePyramid(data, cache.path(hashlib.sha256(key.encode("utf-8")).hexdigest()), binning, scale,
+                           cache=cache, hdul=hdul, blank=blank)
+    return header, pyramid
@@ -0,0 +1,119 @@
+import os
+import logging
+import warnings
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.wcs import WCS
+
+import VAT_fits
+import VAT_manifest
+import VAT_stats
+
+# --- seuils par défaut d'une tuile acceptable
+MAX_NAN_FRACTION = 0.5
+MIN_SNR = 0.
+
+
+def checkHeader(hdu, fileSize, nbPixels):
+    """
+    cohérence du header d'une tuile: image 2D de nbPixels x nbPixels, WCS céleste,
+    données entièrement présentes dans le fichier
+    """
+    problems = []
+    header = hdu.header
+    if header.get("NAXIS") != 2:
+        problems.append("NAXIS = %s"%header.get("NAXIS"))
+    elif header.get("NAXIS1") != nbPixels or header.get("NAXIS2") != nbPixels:
+        problems.append("size %sx%s instead of %dx%d"%(header.get("NAXIS1"), header.get("NAXIS2"), nbPixels, nbPixels))
+    if "CTYPE1" not in header or "CTYPE2" not in header:
+        problems.append("no CTYPE")
+    else:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                if not WCS(header).has_celestial:
+                    problems.append("no celestial WCS")
+        except Exception as e:
+            problems.append("invalid WCS: %s"%e)
+    info = hdu.fileinfo()
+    if info is not None and info["datLoc"] + info["datSpan"] > fileSize:
+        problems.append("truncated: %d bytes instead of %d"%(fileSize, info["datLoc"] + info["datSpan"]))
+    return problems
+
+
+def checkStats(stats, maxNanFraction=MAX_NAN_FRACTION, minSnr=MIN_SNR):
+    """
+    tuile vide, constante ou sans signal, à partir des statistiques de VAT_stats.imageStats
+    (rapport signal/bruit de snrCalculation)
+    """
+    if stats is None:
+        return ["no image data"]
+    problems = []
+    if stats["nanFraction"] > maxNanFraction:
+        problems.append("%.0f%% NaN"%(100.*stats["nanFraction"]))
+    if not np.isfinite(stats["std"]) or stats["std"] == 0.:
+        problems.append("constant image")
+    elif not abs(stats["snr"]) > minSnr:
+        problems.append("snr %.3g"%stats["snr"])
+    if "background" in stats and not np.isfinite(stats["background"]):
+        problems.append("no background")
+    return problems
+
+
+def checkTile(fileImage, nbPixels, stats=None, maxNanFraction=MAX_NAN_FRACTION, minSnr=MIN_SNR):
+    """
+    validation d'une tuile téléchargée. Les statistiques déjà calculées à l'import
+    (enregistrées dans le manifeste) sont réutilisées, sinon le fichier est relu.
+    Retourne la liste des problèmes (vide si la tuile est bonne) et les statistiques
+    """
+    if not os.path.isfile(fileImage):
+        return ["missing file"], stats
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            with fits.open(fileImage, memmap=True, do_not_scale_image_data=True) as hdul:
+                hdu = VAT_fits.imageHDU(hdul)
+                if hdu is None:
+                    return ["no image HDU"], stats
+                problems = checkHeader(hdu, os.path.getsize(fileImage), nbPixels)
+                if len(problems) == 0 and stats is None:
+                    stats = VAT_stats.imageStats(hdu, 3., chunker=VAT_stats.hduChunks)
+    except Exception as e:
+        return ["unreadable: %s"%e], stats
+    if len(problems) == 0:
+        problems = checkStats(stats, maxNanFraction, minSnr)
+    return problems, stats
+
+
+def checkTiles(manifest, tiles, nbPixels, maxNanFraction=MAX_NAN_FRACTION, minSnr=MIN_SNR):
+    """
+    validation des tuiles terminées d'un import: tiles est une liste de (clé, fichier).
+    Retourne le rapport clé -> {file, ok, problems, stats}
+    """
+    report = {}
+    for (key, fileImage) in tiles:
+        if manifest.state(key) != VAT_manifest.DONE:
+            continue
+        entry = manifest.entries.get(key, {})
+        problems, stats = checkTile(fileImage, nbPixels, entry.get("stats"), maxNanFraction, minSnr)
+        report[key] = {"file": os.path.basename(fileImage),
+                       "ok": len(problems) == 0,
+                       "problems": problems,
+                       "stats": stats}
+        if len(problems) > 0:
+            logging.warning("bad tile %s: %s"%(fileImage, ", ".join(problems)))
+    return report
+
+
+def reportFile(targetSpecsFile):
+    return os.path.splitext(targetSpecsFile)[0] + '_quality.json'
+
+
+def writeReport(report, targetSpecsFile):
+    fileName = reportFile(targetSpecsFile)
+    VAT_manifest.atomicJsonDump(report, fileName)
+    bad = len([key for key in report if not report[key]["ok"]])
+    logging.info("quality report %s: %d tiles, %d bad"%(fileName, len(report), bad))
+    return fileName
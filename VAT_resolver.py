@@ -0,0 +1,166 @@
+import os
+import contextlib
+import logging
+import json
+import random
+import threading
+import time
+
+import numpy as np
+
+import VAT_cache
+import VAT_http
+import VAT_lazy
+import VAT_manifest
+
+simbad = VAT_lazy.module("astroquery.simbad", lambda m: VAT_http.mount(m.Simbad._session))
+coordinates = VAT_lazy.module("astropy.coordinates")
+astropyData = VAT_lazy.module("astropy.utils.data")
+
+# --- l'url et le délai Sesame d'astropy sont globaux: changés seulement le temps d'une résolution
+sesameLock = threading.Lock()
+# --- début du message d'astropy quand Sesame a répondu sans trouver l'objet;
+#     les autres NameResolveError sont des échecs du transport (erreur http, délai dépassé)
+NOT_FOUND = "Unable to find coordinates"
+
+
+def isNotFound(error):
+    """
+    vrai si la NameResolveError signifie que l'objet est inconnu, faux pour une panne du service
+    """
+    return str(error).startswith(NOT_FOUND)
+
+
+class NameResolver:
+    """
+    cache persistant de résolution des noms d'objets:
+    coordonnées ICRS et métadonnées Simbad.
+    En mode hors ligne seuls les noms déjà résolus sont connus.
+    Sans useSimbad, les métadonnées se limitent au nom et aux coordonnées données par Sesame
+    (serveur de remplacement sans service Simbad); sesameUrl remplace alors le serveur Sesame.
+    Une panne de Sesame est retentée maxAttempts fois puis remontée: elle n'est jamais prise,
+    ni mise en cache, pour un objet inconnu.
+    timeout (délai de lecture en secondes) s'applique aux requêtes Simbad et Sesame de ce résolveur
+    """
+
+    def __init__(self, cacheFile=None, offline=False, useSimbad=True, sesameUrl=None, maxAttempts=3, baseDelay=1., timeout=None):
+        if cacheFile is None:
+            cacheFile = os.path.join(VAT_cache.defaultCacheDir(), "names.json")
+        logging.info("init NameResolver %s offline: %s"%(cacheFile, offline))
+        self.cacheFile = cacheFile
+        self.offline = offline
+        self.useSimbad = useSimbad
+        self.sesameUrl = sesameUrl
+        self.maxAttempts = maxAttempts
+        self.baseDelay = baseDelay
+        self.timeout = timeout
+        self.simbadInstance = None
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.isfile(cacheFile):
+            with open(cacheFile, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def normalize(objName):
+        return "".join(objName.split()).upper()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cacheFile)), exist_ok=True)
+        VAT_manifest.atomicJsonDump(self.entries, self.cacheFile)
+
+    def update(self, objName, **fields):
+        with self.lock:
+            self.entries.setdefault(self.normalize(objName), {}).update(fields)
+            self.save()
+
+    def simbadService(self):
+        """
+        service Simbad: l'instance partagée d'astroquery, ou une instance propre avec le délai timeout
+        """
+        if self.timeout is None:
+            return simbad.Simbad
+        if self.simbadInstance is None:
+            service = simbad.SimbadClass()
+            service.TIMEOUT = self.timeout
+            VAT_http.mount(service._session, self.timeout)
+            self.simbadInstance = service
+        return self.simbadInstance
+
+    def fromName(self, objName):
+        """
+        coordonnées ICRS données par Sesame, ou par le serveur sesameUrl.
+        Les pannes du service sont retentées avec une attente exponentielle à gigue complète;
+        un objet inconnu lève NameResolveError tout de suite
+        """
+        for attempt in range(self.maxAttempts):
+            try:
+                return self.sesameQuery(objName)
+            except coordinates.name_resolve.NameResolveError as e:
+                if isNotFound(e) or attempt + 1 >= self.maxAttempts:
+                    raise
+                delay = random.uniform(0., self.baseDelay * 2**attempt)
+                logging.warning("Sesame failed for %s, retry in %.1f s: %s"%(objName, delay, e))
+                time.sleep(delay)
+
+    def sesameQuery(self, objName):
+        with sesameLock, contextlib.ExitStack() as stack:
+            if self.sesameUrl is not None:
+                stack.enter_context(coordinates.name_resolve.sesame_url.set([self.sesameUrl]))
+            if self.timeout is not None:
+                stack.enter_context(astropyData.conf.set_temp("remote_timeout", self.timeout))
+            return coordinates.SkyCoord.from_name(objName).icrs
+
+    def query(self, objName):
+        """
+        métadonnées Simbad de l'objet (dictionnaire), None si l'objet est inconnu.
+        Une panne du service lève une exception: seules les réponses sont mises en cache
+        """
+        entry = self.entries.get(self.normalize(objName), {})
+        if "simbad" in entry:
+            return entry["simbad"]
+        if self.offline:
+            logging.warning("offline: %s not in resolver cache"%objName)
+            return None
+        if not self.useSimbad:
+            try:
+                coords = self.fromName(objName)
+            except coordinates.name_resolve.NameResolveError as e:
+                if not isNotFound(e):
+                    raise
+                return None
+            metadata = {"main_id": objName, "ra": coords.ra.degree, "dec": coords.dec.degree}
+            self.update(objName, simbad=metadata)
+            return metadata
+        result = self.simbadService().query_object(objName)
+        if result is None or len(result) == 0:
+            return None
+        metadata = {}
+        for col in result.colnames:
+            value = result[col][0]
+            if np.ma.is_masked(value):
+                value = None
+            elif isinstance(value, np.generic):
+                value = value.item()
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            metadata[col] = value
+        self.update(objName, simbad=metadata)
+        return metadata
+
+    def coordinates(self, objName):
+        """
+        coordonnées ICRS de l'objet
+        """
+        entry = self.entries.get(self.normalize(objName), {})
+        if "ra" not in entry:
+            metadata = entry.get("simbad")
+            if metadata is not None and isinstance(metadata.get("ra"), float) and isinstance(metadata.get("dec"), float):
+                self.update(objName, ra=metadata["ra"], dec=metadata["dec"])
+            elif self.offline:
+                raise coordinates.name_resolve.NameResolveError("offline: %s not in resolver cache"%objName)
+            else:
+                coords = self.fromName(objName)
+                self.update(objName, ra=coords.ra.degree, dec=coords.dec.degree)
+            entry = self.entries[self.normalize(objName)]
+        return coordinates.SkyCoord(entry["ra"], entry["dec"], unit="deg", frame="icrs")
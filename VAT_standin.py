@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+import logging
+import threading
+import time
+import html
+import random
+import hashlib
+from http.server import ThreadingHTTPServer
+from http.server import BaseHTTPRequestHandler
+from urllib import parse as urlparse
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.wcs import WCS
+
+SKYVIEW_PATH = "/current/cgi/query.pl"
+SESAME_PATH = "/cgi-bin/nph-sesame/"
+FITS_PATH = "/tempspace/fits"
+
+SURVEYS = {"dss": ["DSS", "DSS1 Blue", "DSS1 Red", "DSS2 Red", "DSS2 Blue", "DSS2 IR"],
+           "infrared": ["2MASS-J", "2MASS-H", "2MASS-K", "WISE 3.4", "WISE 4.6"],
+           "halpha": ["H-Alpha Comp"]}
+
+# --- quelques objets connus, les autres noms de catalogue reçoivent des coordonnées fixes tirées du nom
+OBJECTS = {"M31": (10.684708, 41.268750),
+           "M32": (10.674300, 40.865169),
+           "M33": (23.462042, 30.660175),
+           "M42": (83.822083, -5.391111),
+           "M51": (202.469575, 47.195258),
+           "M101": (210.802429, 54.348750),
+           "M110": (10.092000, 41.685306),
+           "NGC7000": (314.750000, 44.316667)}
+CATALOGUES = ("M", "NGC", "IC")
+
+CELL = 0.05  # --- côté en degrés des cellules du catalogue d'étoiles synthétique
+
+
+def objectCoordinates(objName):
+    """
+    coordonnées (ra, dec) d'un nom d'objet, None si le nom n'est pas d'un catalogue supporté
+    """
+    name = "".join(objName.split()).upper()
+    if name in OBJECTS:
+        return OBJECTS[name]
+    for c in CATALOGUES:
+        if name.startswith(c) and name[len(c):].isdigit():
+            h = int(hashlib.sha256(name.encode("utf-8")).hexdigest(), 16)
+            return (h % 3600000)/10000., np.degrees(np.arcsin(((h >> 32) % 2000001)/1000000. - 1.))
+    return None
+
+
+def starsInCell(i, j, density):
+    """
+    étoiles d'une cellule du ciel, toujours les mêmes: des tuiles qui se recouvrent montrent les mêmes étoiles
+    """
+    rng = np.random.default_rng([i & 0xffffffff, j & 0xffffffff])
+    dec0 = j*CELL
+    cosdec = max(np.cos(np.radians(dec0 + CELL/2.)), 1.e-3)
+    nb = rng.poisson(density*CELL*CELL*cosdec)
+    ra = (i*CELL + rng.uniform(0., CELL, nb)) % 360.
+    dec = dec0 + rng.uniform(0., CELL, nb)
+    flux = 20000.*rng.pareto(1.5, nb) + 200.
+    return ra, dec, flux
+
+
+def skyImage(ra, dec, pixels, size, survey="DSS", density=2000., fwhm=2.5, seed=None):
+    """
+    image synthétique pixels x pixels en projection TAN centrée sur (ra, dec), de côté size degrés:
+    fond, bruit et étoiles d'un catalogue déterministe placées par le WCS. Retourne un PrimaryHDU en entiers 16 bits
+    """
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    wcs.wcs.crval = [ra, dec]
+    wcs.wcs.crpix = [(pixels + 1)/2., (pixels + 1)/2.]
+    wcs.wcs.cdelt = [-size/pixels, size/pixels]
+    wcs.wcs.radesys = "FK5"
+    wcs.wcs.equinox = 2000.
+    # --- cellules du catalogue qui couvrent l'image (cercle englobant)
+    radius = size/np.sqrt(2.) + CELL
+    j0 = int(np.floor(max(-90., dec - radius)/CELL))
+    j1 = int(np.floor(min(90., dec + radius)/CELL))
+    raRadius = min(180., radius/max(np.cos(np.radians(min(89.9, abs(dec) + radius))), 1.e-3))
+    i0 = int(np.floor((ra - raRadius)/CELL))
+    i1 = int(np.floor((ra + raRadius)/CELL))
+    nbCells = int(np.ceil(360./CELL))
+    stars = [starsInCell(i % nbCells, j, density) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+    if len(stars) > 0:
+        sra = np.concatenate([s[0] for s in stars])
+        sdec = np.concatenate([s[1] for s in stars])
+        flux = np.concatenate([s[2] for s in stars])
+    else:
+        sra = sdec = flux = np.zeros(0)
+    rng = np.random.default_rng(seed)
+    data = rng.normal(1000., 30., (pixels, pixels))
+    if len(flux) > 0:
+        x, y = wcs.world_to_pixel_values(sra, sdec)
+        sigma = fwhm/2.355
+        half = int(np.ceil(4*sigma))
+        inside = (x > -half) & (x < pixels + half) & (y > -half) & (y < pixels + half)
+        for xs, ys, f in zip(x[inside], y[inside], flux[inside]):
+            xa, xb = max(0, int(xs) - half), min(pixels, int(xs) + half + 1)
+            ya, yb = max(0, int(ys) - half), min(pixels, int(ys) + half + 1)
+            if xb <= xa or yb <= ya:
+                continue
+            yy, xx = np.mgrid[ya:yb, xa:xb]
+            data[ya:yb, xa:xb] += f/(2*np.pi*sigma**2)*np.exp(-((xx - xs)**2 + (yy - ys)**2)/(2*sigma**2))
+    header = wcs.to_header()
+    header["SURVEY"] = survey
+    header["ORIGIN"] = "VAT_standin"
+    return fits.PrimaryHDU(np.clip(data, -32768, 32767).astype(np.int16), header)
+
+
+class StandinServer:
+    """
+    serveur local qui remplace SkyView (formulaire, page de résultats, images fits) et Sesame (résolution des noms).
+    latency: délai ajouté à chaque réponse (secondes), errorRate: proportion de réponses 503,
+    bandwidth: débit maximal de chaque réponse (octets/s), None pour illimité
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0., errorRate=0., bandwidth=None, density=2000., seed=None):
+        self.latency = latency
+        self.errorRate = errorRate
+        self.bandwidth = bandwidth
+        self.density = density
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "bytes": 0}
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logging.debug("VAT_standin: " + format%args)
+
+            def do_GET(self):
+                standin.handle(self)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        URL de base à donner à VAT_interface (baseUrl)
+        """
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d"%(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="VAT_standin", daemon=True)
+        self.thread.start()
+        logging.info("VAT_standin listening on %s"%self.url)
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counts[name] += value
+
+    def send(self, handler, body, contentType="text/html", status=200):
+        handler.send_response(status)
+        handler.send_header("Content-Type", contentType)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if self.bandwidth is None:
+            handler.wfile.write(body)
+        else:
+            chunk = max(1, int(self.bandwidth/20))
+            for k in range(0, len(body), chunk):
+                t0 = time.monotonic()
+                handler.wfile.write(body[k:k + chunk])
+                time.sleep(max(0., len(body[k:k + chunk])/self.bandwidth - (time.monotonic() - t0)))
+        self.count("bytes", len(body))
+
+    def handle(self, handler):
+        self.count("requests")
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            failed = self.random.random() < self.errorRate
+        if failed:
+            self.count("errors")
+            self.send(handler, b"service unavailable", "text/plain", 503)
+            return
+        url = urlparse.urlparse(handler.path)
+        params = urlparse.parse_qs(url.query)
+        try:
+            if url.path == SKYVIEW_PATH and "Position" not in params:
+                self.send(handler, self.form().encode("utf-8"))
+            elif url.path == SKYVIEW_PATH:
+                self.send(handler, self.results(params).encode("utf-8"))
+            elif url.path == FITS_PATH:
+                self.send(handler, self.image(params), "application/fits")
+            elif url.path.startswith(SESAME_PATH):
+                self.send(handler, self.sesame(urlparse.unquote(url.query)).encode("utf-8"), "text/plain")
+            else:
+                self.send(handler, b"not found", "text/plain", 404)
+        except Exception as e:
+            logging.exception("VAT_standin: %s"%handler.path)
+            self.send(handler, str(e).encode("utf-8"), "text/plain", 400)
+
+    def form(self):
+        selects = []
+        for group, surveys in SURVEYS.items():
+            options = "".join("<option>%s</option>"%html.escape(s) for s in surveys)
+            selects.append('<select name="survey" id="%s" multiple>%s</select>'%(group, options))
+        return ('<html><body><form action="%s" method="get">'
+                '<input type="text" name="Position">%s'
+                '<input type="text" name="pixels" value="300">'
+                '<input type="submit" value="Submit">'
+                '</form></body></html>')%(SKYVIEW_PATH, "".join(selects))
+
+    def position(self, position):
+        """
+        position du formulaire: "ra dec" en degrés, ou nom d'objet
+        """
+        try:
+            ra, dec = [float(v) for v in position.replace(",", " ").split()[:2]]
+            return ra, dec
+        except ValueError:
+            coords = objectCoordinates(position)
+            if coords is None:
+                raise ValueError("unknown position %s"%position)
+            return coords
+
+    def results(self, params):
+        ra, dec = self.position(params["Position"][0])
+        pixels = params.get("pixels", ["300"])[0]
+        size = params.get("size", ["0.25"])[0].split(",")[0]
+        links = []
+        for survey in params.get("survey", []):
+            query = urlparse.urlencode({"survey": survey, "ra": ra, "dec": dec, "pixels": pixels, "size": size})
+            links.append('<a href="%s?%s">FITS</a>'%(FITS_PATH, query))
+        return "<html><body>%s</body></html>"%"<br>".join(links)
+
+    def image(self, params):
+        hdu = skyImage(float(params["ra"][0]), float(params["dec"][0]), int(params["pixels"][0]),
+                       float(params["size"][0]), params["survey"][0], self.density)
+        header = hdu.header.tostring().encode("ascii")
+        data = hdu.data.astype(">i2").tobytes()
+        return header + data + b'\0'*((-len(data)) % 2880)
+
+    def sesame(self, objName):
+        """
+        réponse au format Sesame: la ligne %J porte les coordonnées ICRS en degrés
+        """
+        coords = objectCoordinates(objName)
+        if coords is None:
+            return "# %s\n#! *** Nothing found *** \n"%objName
+        return "# %s\n%%I.0 %s\n%%J %.6f %+.6f = VAT_standin\n"%(objName, objName, coords[0], coords[1])
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="VAT stand-in: local SkyView and Sesame services with synthetic images")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800, help="(default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0., help="delay added to each response, in seconds (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0., help="fraction of requests answered with an HTTP 503 error (default: %(default)s)")
+    parser.add_argument("--bandwidth", type=float, default=None, help="maximum bytes per second of each response")
+    parser.add_argument("--density", type=float, default=2000., help="synthetic stars per square degree (default: %(default)s)")
+    parser.add_argument("--log", default="INFO", help="logging level (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    logging.basicConfig(level=getattr(logging, args.log.upper()))
+    standin = StandinServer(args.host, args.port, args.latency, args.error_rate, args.bandwidth, args.density)
+    print("VAT_standin: use --base-url %s (or VAT_BASE_URL=%s)"%(standin.url, standin.url))
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    standin.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import logging
+
+import numpy as np
+
+from astropy.io import fits
+
+import VAT_fits
+
+
+class RunningStats:
+    """
+    moyenne, variance, min et max cumulés bloc par bloc (combinaison de Chan et al.),
+    en ignorant les NaN: une seule lecture des données, sans copie de l'image entière
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.nanCount = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, chunk, low=None, high=None):
+        """
+        ajoute un bloc; avec low/high seules les valeurs dans [low, high] sont comptées
+        """
+        chunk = np.asarray(chunk, dtype=np.float64).ravel()
+        finite = np.isfinite(chunk)
+        self.nanCount += chunk.size - np.count_nonzero(finite)
+        if low is not None:
+            finite &= (chunk >= low) & (chunk <= high)
+        values = chunk[finite]
+        nb = values.size
+        if nb == 0:
+            return
+        meanb = values.mean()
+        m2b = np.square(values - meanb).sum()
+        n = self.n + nb
+        delta = meanb - self.mean
+        self.mean += delta*nb/n
+        self.m2 += m2b + delta*delta*self.n*nb/n
+        self.n = n
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2/self.n) if self.n > 0 else np.nan
+
+
+def chunks(data, maxElements=1 << 22):
+    """
+    découpe une image (éventuellement un memmap) en bandes de lignes
+    """
+    data = np.asanyarray(data)
+    if data.ndim < 2:
+        yield data
+        return
+    rowSize = int(np.prod(data.shape[1:]))
+    rows = max(1, maxElements//max(1, rowSize))
+    for r in range(0, data.shape[0], rows):
+        yield data[r:r + rows]
+
+
+def hduChunks(hdu, maxElements=1 << 22):
+    """
+    découpe l'image d'un HDU en bandes de lignes lues par VAT_fits.readRows: seules ces lignes
+    sont lues, ou décompressées pour un CompImageHDU. Le fichier doit être ouvert avec do_not_scale_image_data
+    """
+    shape = hdu.shape
+    rowSize = int(np.prod(shape[1:]))
+    rows = max(1, maxElements//max(1, rowSize))
+    for r in range(0, shape[0], rows):
+        yield VAT_fits.readRows(hdu, r, min(r + rows, shape[0]))
+
+
+def imageStats(data, sigmaClip=None, iterations=3, chunker=chunks):
+    """
+    statistiques d'une image en un passage par bandes, NaN ignorés.
+    chunker(data) donne les bandes: chunks pour un tableau, hduChunks pour un HDU lu à la demande.
+    Avec sigmaClip, le fond (background, backgroundStd) est estimé en rejetant
+    itérativement les pixels à plus de sigmaClip écarts-types (un passage par itération)
+    """
+    stats = RunningStats()
+    for chunk in chunker(data):
+        stats.add(chunk)
+    size = stats.n + stats.nanCount
+    res = {"pixels": int(size),
+           "nanFraction": float(stats.nanCount/size) if size > 0 else 1.,
+           "mean": float(stats.mean) if stats.n > 0 else np.nan,
+           "std": float(stats.std),
+           "min": float(stats.min) if stats.n > 0 else np.nan,
+           "max": float(stats.max) if stats.n > 0 else np.nan}
+    res["snr"] = res["mean"]/res["std"] if res["std"] > 0 else np.nan
+    if sigmaClip is not None and stats.n > 0:
+        background = stats
+        for it in range(iterations):
+            low = background.mean - sigmaClip*background.std
+            high = background.mean + sigmaClip*background.std
+            clipped = RunningStats()
+            for chunk in chunker(data):
+                clipped.add(chunk, low, high)
+            if clipped.n == 0 or clipped.n == background.n:
+                break
+            background = clipped
+        res["background"] = float(background.mean)
+        res["backgroundStd"] = float(background.std)
+    return res
+
+
+def fileStats(fileName, sigmaClip=3.):
+    """
+    statistiques de la première image d'un fichier fits (éventuellement compressé),
+    lue par bandes de lignes sans charger l'image entière
+    """
+    with fits.open(fileName, memmap=True, do_not_scale_image_data=True) as hdul:
+        hdu = VAT_fits.imageHDU(hdul)
+        if hdu is None:
+            logging.warning("no image in %s"%fileName)
+            return None
+        return imageStats(hdu, sigmaClip, chunker=hduChunks)
+
+
+def snrCalculation(picture):
+    """
+    rapport signal/bruit (moyenne / écart type) et niveau moyen du bruit (picture - moyenne),
+    nul par construction
+    """
+    stats = imageStats(picture)
+    return stats["snr"], 0.
@@ -0,0 +1,175 @@
+import os
+import logging
+import json
+import threading
+
+import numpy as np
+
+import VAT_manifest
+
+# --- distance maximale entre le centre d'une tuile réutilisée et le centre demandé, en fraction du côté de la tuile
+TOLERANCE = 0.05
+# --- et en fraction du pas de la grille demandée: deux tuiles voisines ne peuvent pas recevoir la même tuile
+SPACING_FRACTION = 0.25
+
+
+def unitVectors(ra, dec):
+    """
+    vecteurs unitaires (x, y, z) des positions ra, dec en degrés
+    """
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    return np.stack([np.cos(dec)*np.cos(ra), np.cos(dec)*np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def tangentFrame(v):
+    """
+    axes est et nord du plan tangent en v
+    """
+    east = np.array([-v[1], v[0], 0.])
+    norm = np.linalg.norm(east)
+    east = np.array([0., 1., 0.]) if norm < 1.e-12 else east/norm
+    return east, np.cross(v, east)
+
+
+def contains(candidate, requested, radius, margin):
+    """
+    l'empreinte d'une tuile centrée sur candidate (carré de côté 2 x radius degrés, axes est et nord
+    de la projection TAN) contient celle de la tuile demandée, à margin degrés près
+    """
+    east, north = tangentFrame(requested)
+    h = np.radians(radius)
+    corners = np.array([requested + sx*h*east + sy*h*north for sx in (-1., 1.) for sy in (-1., 1.)])
+    east, north = tangentFrame(candidate)
+    depth = corners @ candidate
+    if np.any(depth <= 0.):
+        return False
+    x = np.degrees(corners @ east/depth)
+    y = np.degrees(corners @ north/depth)
+    return bool(np.all(np.abs(x) <= radius + margin) and np.all(np.abs(y) <= radius + margin))
+
+
+class TileIndex:
+    """
+    index spatial des tuiles du cache de découpes, par groupe (survey, rayon, pixels).
+    Retrouve une tuile déjà téléchargée par un autre plan (origin), dont le centre est à moins de
+    tolerance x côté de la tuile du centre demandé et dont l'empreinte contient celle demandée à cette
+    distance près: cibles voisines (M31, M32, M110) ou campagnes dont les grilles se recouvrent.
+    Les centres d'un groupe sont triés par déclinaison: une recherche ne compare, par produit scalaire
+    des vecteurs unitaires, que la bande de déclinaison autour du centre demandé.
+    Partagé entre les threads de téléchargement, et entre processus par le fichier: save relit
+    le fichier sous un verrou et n'y applique que les ajouts et retraits de ce processus.
+    Une clé dont la tuile a quitté le cache est retirée par l'appelant (défaut de cache)
+    """
+
+    def __init__(self, fileName, tolerance=TOLERANCE):
+        logging.info("init TileIndex %s tolerance: %s"%(fileName, tolerance))
+        self.fileName = fileName
+        self.tolerance = tolerance
+        self.lock = threading.Lock()
+        # --- groupe -> {clé du cache: [ra, dec, plan d'origine]}
+        self.groups = {}
+        # --- groupe -> (déclinaisons triées, vecteurs unitaires, clés, origines), reconstruit après modification
+        self.arrays = {}
+        # --- groupe -> {clé: entrée, None si retirée}: changements de ce processus depuis le dernier save
+        self.changes = {}
+        self.groups = self.load()
+
+    def load(self):
+        if not os.path.isfile(self.fileName):
+            return {}
+        try:
+            with open(self.fileName, encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            logging.warning("tile index %s unreadable, restarted empty"%self.fileName)
+            return {}
+
+    @staticmethod
+    def group(survey, radius, pixels):
+        return json.dumps([survey, "%.9g"%radius, int(pixels)])
+
+    def add(self, survey, radius, pixels, ra, dec, key, origin=None):
+        group = self.group(survey, radius, pixels)
+        entry = [float(ra), float(dec), origin]
+        with self.lock:
+            self.groups.setdefault(group, {})[key] = entry
+            self.changes.setdefault(group, {})[key] = entry
+            self.arrays.pop(group, None)
+
+    def remove(self, survey, radius, pixels, key):
+        group = self.group(survey, radius, pixels)
+        with self.lock:
+            if self.groups.get(group, {}).pop(key, None) is not None:
+                self.arrays.pop(group, None)
+            self.changes.setdefault(group, {})[key] = None
+
+    def maxDistance(self, radius, spacing=None):
+        """
+        distance de réutilisation: tolérance x côté de la tuile (2 x rayon pour SkyView),
+        au plus SPACING_FRACTION x pas de la grille demandée
+        """
+        distance = self.tolerance*2.*radius
+        if spacing is not None and spacing > 0.:
+            distance = min(distance, SPACING_FRACTION*spacing)
+        return distance
+
+    def nearest(self, survey, radius, pixels, ra, dec, maxDistance=None, origin=None):
+        """
+        clé et distance (degrés) de la tuile la plus proche à moins de maxDistance (par défaut self.maxDistance(radius)),
+        téléchargée par un autre plan que origin et dont l'empreinte contient celle demandée, sinon (None, None)
+        """
+        if maxDistance is None:
+            maxDistance = self.maxDistance(radius)
+        if maxDistance <= 0.:
+            return None, None
+        group = self.group(survey, radius, pixels)
+        with self.lock:
+            arrays = self.arrays.get(group)
+            if arrays is None:
+                entries = self.groups.get(group)
+                if not entries:
+                    return None, None
+                keys = sorted(entries, key=lambda k: entries[k][1])
+                decs = np.array([entries[k][1] for k in keys])
+                origins = [entries[k][2] if len(entries[k]) > 2 else None for k in keys]
+                arrays = (decs, unitVectors(np.array([entries[k][0] for k in keys]), decs), keys, origins)
+                self.arrays[group] = arrays
+        decs, vectors, keys, origins = arrays
+        i0 = np.searchsorted(decs, dec - maxDistance, side="left")
+        i1 = np.searchsorted(decs, dec + maxDistance, side="right")
+        if i0 == i1:
+            return None, None
+        requested = unitVectors(ra, dec)
+        distances = np.degrees(np.arccos(np.clip(vectors[i0:i1] @ requested, -1., 1.)))
+        for k in np.argsort(distances):
+            if distances[k] > maxDistance:
+                break
+            if origin is not None and origins[i0 + k] == origin:
+                continue
+            if not contains(vectors[i0 + k], requested, radius, maxDistance):
+                continue
+            return keys[i0 + k], float(distances[k])
+        return None, None
+
+    def save(self):
+        """
+        fusionne les changements de ce processus dans le fichier, relu sous un verrou entre processus:
+        les tuiles ajoutées par les autres processus sont gardées, et deviennent visibles ici
+        """
+        with self.lock:
+            if len(self.changes) == 0:
+                return
+            with VAT_manifest.fileLock(self.fileName):
+                groups = self.load()
+                for group, changes in self.changes.items():
+                    entries = groups.setdefault(group, {})
+                    for key, entry in changes.items():
+                        if entry is None:
+                            entries.pop(key, None)
+                        else:
+                            entries[key] = entry
+                VAT_manifest.atomicJsonDump(groups, self.fileName)
+            self.groups = groups
+            self.arrays = {}
+            self.changes = {}
@@ -0,0 +1,50 @@
+import time
+import threading
+import logging
+
+from PySide2.QtCore import QObject, QRunnable, Signal, Slot
+
+
+class WorkerSignals(QObject):
+    """
+    signaux émis par un VATworker vers le thread de l'interface
+    """
+    finished = Signal(object)
+    error = Signal(str)
+    progress = Signal(int, int, float, float)  # --- tuiles terminées, total, débit (Mo/s), temps restant (s)
+
+
+class VATworker(QRunnable):
+    """
+    exécute une fonction bloquante (accès réseau) hors du thread de l'interface Qt
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.cancelEvent = threading.Event()
+        self.startTime = time.monotonic()
+
+    def cancel(self):
+        logging.info("VATworker.cancel")
+        self.cancelEvent.set()
+
+    def reportProgress(self, done, total, nbytes):
+        elapsed = time.monotonic() - self.startTime
+        throughput = nbytes/elapsed/1.e6 if elapsed > 0 else 0.
+        eta = elapsed*(total - done)/done if done > 0 else -1.
+        self.signals.progress.emit(done, total, throughput, eta)
+
+    @Slot()
+    def run(self):
+        self.startTime = time.monotonic()
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            logging.exception("VATworker error")
+            self.signals.error.emit(str(e))
+            return
+        self.signals.finished.emit(result)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import sys
+import os
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from astropy.io import fits
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import VAT_fits
+
+
+def syntheticTile(nbPixels, dtype, seed=0):
+    """
+    tuile de ciel: fond, bruit et quelques étoiles gaussiennes, en entiers (type DSS) ou en réels
+    """
+    rng = np.random.default_rng(seed)
+    data = 5000. + rng.normal(0., 50., (nbPixels, nbPixels))
+    yy, xx = np.mgrid[0:nbPixels, 0:nbPixels]
+    for k in range(nbPixels//20):
+        x, y = rng.uniform(0, nbPixels, 2)
+        data += rng.uniform(100., 20000.)*np.exp(-((xx - x)**2 + (yy - y)**2)/(2.*rng.uniform(1., 3.)**2))
+    if np.dtype(dtype).kind in "iu":
+        data = np.clip(data, 0, 32767)
+    header = fits.Header()
+    header["CTYPE1"] = "RA---TAN"
+    header["CTYPE2"] = "DEC--TAN"
+    header["CRVAL1"] = 10.68
+    header["CRVAL2"] = 41.27
+    header["CRPIX1"] = nbPixels/2.
+    header["CRPIX2"] = nbPixels/2.
+    header["CDELT1"] = -1.e-4
+    header["CDELT2"] = 1.e-4
+    return fits.PrimaryHDU(data.astype(dtype), header)
+
+
+def benchFile(fileName, outputFormat, directory, repeat):
+    """
+    temps de compression et de relecture d'un fichier, taux de compression et erreur maximale
+    """
+    reference = fits.getdata(fileName).astype(np.float64)
+    rawSize = os.path.getsize(fileName)
+    writeTimes = []
+    readTimes = []
+    for r in range(repeat):
+        work = os.path.join(directory, "tile.fits")
+        shutil.copyfile(fileName, work)
+        t0 = time.perf_counter()
+        size = VAT_fits.compressFits(work, outputFormat)
+        writeTimes.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        with fits.open(work) as hdul:
+            data = VAT_fits.imageHDU(hdul).data.astype(np.float64)
+        readTimes.append(time.perf_counter() - t0)
+    with np.errstate(invalid="ignore"):
+        error = float(np.nanmax(np.abs(data - reference)))
+    writeTime = min(writeTimes)
+    return {"format": outputFormat,
+            "rawBytes": rawSize,
+            "bytes": size,
+            "ratio": rawSize/size,
+            "writeSeconds": writeTime,
+            "writeMBps": rawSize/1.e6/writeTime,
+            "readSeconds": min(readTimes),
+            "maxError": error}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="write throughput and compression ratio of the tile output formats")
+    parser.add_argument("files", nargs="*", help="fits tiles to compress (default: synthetic int16 and float32 tiles)")
+    parser.add_argument("--pixels", type=int, default=1000, help="size of the synthetic tiles (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per file and format, the fastest is kept (default: %(default)s)")
+    parser.add_argument("--output", default=None, help="json results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        files = args.files
+        if len(files) == 0:
+            for dtype in ("int16", "float32"):
+                fileName = os.path.join(directory, "synthetic_%s.fits"%dtype)
+                syntheticTile(args.pixels, dtype).writeto(fileName)
+                files.append(fileName)
+        for fileName in files:
+            for outputFormat in VAT_fits.FORMATS:
+                res = benchFile(fileName, outputFormat, directory, args.repeat)
+                res["file"] = os.path.basename(fileName)
+                results.append(res)
+    val = json.dumps(results, indent=4)
+    if args.output is None:
+        print(val)
+    else:
+        with open(args.output, 'w', encoding="utf-8") as f:
+            f.write(val)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
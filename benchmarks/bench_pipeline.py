@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import sys
+import os
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from astroquery import cache_conf
+
+import VAT_cache
+import VAT_interface
+import VAT_standin
+
+OBJNAME = "M31"
+CHANNELS = ["DSS", "DSS2 Red", "DSS2 Blue", "DSS2 IR"]
+
+
+def measure(fn, *args, repeat=1):
+    """
+    meilleur temps sur repeat exécutions, et pic de mémoire Python (tracemalloc) de la première
+    """
+    times = []
+    peak = None
+    result = None
+    for r in range(repeat):
+        if r == 0:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - t0)
+        if r == 0:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return {"seconds": min(times), "peakBytes": peak}, result
+
+
+def makeInterface(directory, workers, server):
+    """
+    interface branchée sur le serveur VAT_standin, avec un cache de découpes vide
+    """
+    vati = VAT_interface.VAT_interface(workers, cache=VAT_cache.CutoutCache(os.path.join(directory, "cutouts")),
+                                       baseUrl=server.url)
+    vati.resolver.coordinates(OBJNAME)
+    return vati
+
+
+def specsFor(directory, nbChannels, nbPixels, fov):
+    specs = {"le_target": OBJNAME,
+             "dsb_visionField": fov,
+             "dsb_percentCoverage": 10.,
+             "dsb_resolution": 1.,
+             "sb_nbPixels": nbPixels,
+             "targetSpecsFile": os.path.join(directory, OBJNAME + ".json")}
+    for j in range(4):
+        specs["cb_surveyChannel%d"%(j + 1)] = CHANNELS[j] if j < nbChannels else "none"
+    return specs
+
+
+def fovForGrid(nbTiles, nbPixels, cover=10.):
+    """
+    champ qui donne une grille de nbTiles x nbTiles tuiles (inverse de calculateNbTiles)
+    """
+    tileFov = nbPixels/3600.
+    return tileFov*(nbTiles*(1. - cover/100.) + cover/100.) - 1.e-6
+
+
+def benchPlanning(server, grids, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        vati = makeInterface(directory, 1, server)
+        for nbTiles in grids:
+            fov = fovForGrid(nbTiles, 300)
+            res, (n, tileFov, cover) = measure(vati.calculateNbTiles, fov, 10., 1., 300, repeat=repeat)
+            results.append(dict(res, benchmark="calculateNbTiles", grid=nbTiles))
+            res, centers = measure(vati.tilesCoordinates, OBJNAME, n, tileFov, cover, repeat=repeat)
+            results.append(dict(res, benchmark="tilesCoordinates", grid=nbTiles, tiles=len(centers)))
+    return results
+
+
+def benchImport(server, grids, channels, nbPixels, workers):
+    results = []
+    for nbTiles in grids:
+        for nbChannels in channels:
+            with tempfile.TemporaryDirectory() as directory:
+                vati = makeInterface(directory, workers, server)
+                specs = specsFor(directory, nbChannels, nbPixels, fovForGrid(nbTiles, nbPixels))
+                n, tileFov, cover = vati.calculateNbTiles(specs["dsb_visionField"], 10., 1., nbPixels)
+                centers = vati.tilesCoordinates(OBJNAME, n, tileFov, cover)
+                counts = dict(server.counts)
+                res, failures = measure(vati.importFits, json.dumps(specs), centers, tileFov)
+                vati.scheduler.shutdown()
+                n = int(n)
+                files = n*n*nbChannels
+                results.append(dict(res, benchmark="importFits", grid=n, channels=nbChannels,
+                                    pixels=nbPixels, workers=workers, latency=server.latency,
+                                    errorRate=server.errorRate, bandwidth=server.bandwidth,
+                                    files=files, failures=len(failures),
+                                    requests=server.counts["requests"] - counts["requests"],
+                                    serverErrors=server.counts["errors"] - counts["errors"],
+                                    filesPerSecond=files/res["seconds"]))
+                logging.warning("importFits %dx%d, %d channels: %.2f s"%(n, n, nbChannels, res["seconds"]))
+    return results
+
+
+def benchGraphics(server, grids, nbPixels, repeat):
+    """
+    temps d'affichage de VATgraphics (plateforme Qt offscreen): image, zoom, contours des tuiles
+    """
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide2.QtWidgets import QApplication
+        import VAT_graphics
+    except ImportError as e:
+        return [{"benchmark": "VATgraphics", "skipped": str(e)}]
+    results = []
+    app = QApplication.instance() or QApplication([])
+    with tempfile.TemporaryDirectory() as directory:
+        vati = makeInterface(directory, 1, server)
+        imageFile = os.path.join(directory, "image.fits")
+        VAT_standin.skyImage(10.684708, 41.26875, nbPixels, 1.).writeto(imageFile)
+        graphics = VAT_graphics.VATgraphics()
+        graphics.resize(800, 800)
+        res, r = measure(graphics.plotImage, imageFile, repeat=repeat)
+        results.append(dict(res, benchmark="plotImage", pixels=nbPixels))
+        ny, nx = graphics.pyramid.shape
+        res, r = measure(lambda: (graphics.ax.set_xlim(nx/4., nx/2.), graphics.ax.set_ylim(ny/4., ny/2.), graphics.canvas.draw()), repeat=repeat)
+        results.append(dict(res, benchmark="zoom", pixels=nbPixels))
+        for nbTiles in grids:
+            n, tileFov, cover = vati.calculateNbTiles(fovForGrid(nbTiles, 300), 10., 1., 300)
+            centers = vati.tilesCoordinates(OBJNAME, n, tileFov, cover)
+            # --- deux bascules par mesure: affichage puis effacement des contours
+            res, r = measure(lambda: (graphics.plotOverviewTiles(centers, n, tileFov), graphics.plotOverviewTiles(centers, n, tileFov)), repeat=repeat)
+            results.append(dict(res, benchmark="plotOverviewTiles", grid=nbTiles))
+    app.processEvents()
+    return results
+
+
+def gitVersion():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, previousFile):
+    """
+    rapport entre les temps de deux exécutions, pour les mesures de mêmes paramètres
+    """
+    with open(previousFile, encoding="utf-8") as f:
+        previous = json.load(f)["results"]
+    def key(res):
+        return json.dumps({k: v for k, v in res.items() if k in ("benchmark", "grid", "channels", "pixels", "workers", "latency", "errorRate", "bandwidth")}, sort_keys=True)
+    before = {key(res): res for res in previous if "seconds" in res}
+    for res in results:
+        old = before.get(key(res))
+        if old is not None and "seconds" in res:
+            print("%-70s %10.4f s -> %10.4f s  x%.2f"%(key(res), old["seconds"], res["seconds"], old["seconds"]/res["seconds"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VAT benchmarks: tile planning, import against a local VAT_standin server, rendering")
+    parser.add_argument("--grids", type=int, nargs="+", default=[2, 5, 10, 20, 50, 100], help="tiles per axis of the planning and rendering benchmarks (default: %(default)s)")
+    parser.add_argument("--import-grids", type=int, nargs="+", default=[2, 5, 10], help="tiles per axis of the import benchmark (default: %(default)s)")
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 2, 3, 4], help="numbers of channels of the import benchmark (default: %(default)s)")
+    parser.add_argument("--pixels", type=int, default=300, help="pixels per tile (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=4, help="parallel downloads (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.05, help="latency of the stand-in server, in seconds (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0., help="fraction of stand-in server errors (default: %(default)s)")
+    parser.add_argument("--bandwidth", type=float, default=None, help="maximum bytes per second of each stand-in server response")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the fast benchmarks, the fastest is kept (default: %(default)s)")
+    parser.add_argument("--only", choices=["planning", "import", "graphics"], nargs="+", default=["planning", "import", "graphics"])
+    parser.add_argument("--output", default=None, help="json results file (default: stdout)")
+    parser.add_argument("--compare", default=None, help="previous json results file to compare with")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    # --- les requêtes des tuiles ne passent jamais par le cache d'astroquery, l'aperçu non plus ici
+    cache_conf.cache_active = False
+
+    # --- caches (découpes, pyramides) dans un répertoire temporaire
+    cacheDir = tempfile.TemporaryDirectory()
+    os.environ["VAT_CACHE_DIR"] = cacheDir.name
+    results = []
+    with VAT_standin.StandinServer(latency=args.latency, errorRate=args.error_rate, bandwidth=args.bandwidth, seed=0) as server:
+        if "planning" in args.only:
+            results += benchPlanning(server, args.grids, args.repeat)
+        if "import" in args.only:
+            results += benchImport(server, args.import_grids, args.channels, args.pixels, args.workers)
+        if "graphics" in args.only:
+            results += benchGraphics(server, args.grids, args.pixels*10, args.repeat)
+    cacheDir.cleanup()
+    val = json.dumps({"version": gitVersion(),
+                      "python": platform.python_version(),
+                      "machine": platform.machine(),
+                      "cpus": os.cpu_count(),
+                      "results": results}, indent=4)
+    if args.output is None:
+        print(val)
+    else:
+        with open(args.output, 'w', encoding="utf-8") as f:
+            f.write(val)
+    if args.compare is not None:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import sys
+import os
+import argparse
+import re
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- import et calcul des tuiles, sans réseau: rien de lourd ne doit être chargé
+STARTUP = "import VAT_batch; VAT_batch.VAT_interface.VAT_interface(1).calculateNbTiles(1., 10., 1., 300)"
+
+# --- modules chargés seulement à la première requête ou au premier affichage
+HEAVY = ("astroquery", "astropy.coordinates", "astropy.wcs", "astropy.io.fits", "astropy.visualization", "matplotlib")
+
+
+def importTimes(code):
+    """
+    profil de python -X importtime dans un nouveau processus: {module: (propre, cumulé)} en secondes
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, cwd=ROOT, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    times = {}
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if m is not None:
+            times[m.group(4)] = (int(m.group(1))*1.e-6, int(m.group(2))*1.e-6)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VAT startup profile: import time of VAT_batch and heavy modules loaded too early")
+    parser.add_argument("--budget", type=float, default=0.5, help="maximum cumulated import time of VAT_batch, in seconds (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules listed (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    times = importTimes(STARTUP)
+    total = times["VAT_batch"][1]
+    for name, (own, cumulated) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print("%-50s %8.3f s  (cumulated %8.3f s)"%(name, own, cumulated))
+    print("import VAT_batch: %.3f s (budget %.3f s)"%(total, args.budget))
+    status = 0
+    loaded = sorted(name for name in times if name.startswith(HEAVY))
+    if loaded:
+        print("heavy modules imported at startup: %s"%", ".join(loaded))
+        status = 1
+    if total > args.budget:
+        print("startup import time over budget")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,9 @@ CONDA_ROOT=$(realpath "$(dirname $(which conda))/..")
 
 conda activate astro
 export LANG='C'
-pyside2-uic main.ui > ui_mainwindow.py
+# --- regenerate the Qt form only when main.ui has changed
+if [ ! -f ui_mainwindow.py ] || [ main.ui -nt ui_mainwindow.py ]; then
+    pyside2-uic main.ui > ui_mainwindow.py
+fi
 
 ./mainGui.py
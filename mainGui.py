@@ -14,6 +14,7 @@ import json
 
 import VAT_interface
 import VAT_graphics
+import VAT_worker
 
 class VATGui(QMainWindow, Ui_MainWindow):
     """
@@ -32,6 +33,18 @@ class VATGui(QMainWindow, Ui_MainWindow):
         self.graphics = VAT_graphics.VATgraphics()
         self.graphLayout.addWidget(self.graphics)
 
+        # --- network operations run in a thread pool, progress and cancel in the status bar
+        self.threadPool = QThreadPool.globalInstance()
+        self.workers = set()
+        self.importWorker = None
+        self.progressBar = QProgressBar()
+        self.progressBar.setVisible(False)
+        self.pb_cancelImport = QPushButton("Cancel import")
+        self.pb_cancelImport.setVisible(False)
+        self.pb_cancelImport.clicked.connect(self.pb_cancelImport_clicked)
+        self.statusbar.addPermanentWidget(self.progressBar)
+        self.statusbar.addPermanentWidget(self.pb_cancelImport)
+
         self.tbw.setTabText(0, "Target overview")
         self.tbw.setTabText(1, "Fits specifications")
         self.tbw.setTabText(2, "Download data")
@@ -79,10 +92,13 @@ class VATGui(QMainWindow, Ui_MainWindow):
         self.cb_surveyChannel4.setCurrentText('DSS2 IR')
         self.target = {}
         self.targetSpecsFile = ""
+        self.generation = 0
+        self.targetChecked = False
         self.reset()
 
     def reset(self):
         logging.info("reset")
+        self.generation += 1
         self.tileCoordinatesCenters = []
         self.nbTiles = 0
         self.tileFov = 0
@@ -99,6 +115,7 @@ class VATGui(QMainWindow, Ui_MainWindow):
     def le_target_textChanged(self):
         logging.info("le_target_textChanged")
         self.reset()
+        self.targetChecked = False
         self.pb_generateOverview.setEnabled(False)
 
     def dsb_visionField_valueChanged(self):
@@ -107,15 +124,65 @@ class VATGui(QMainWindow, Ui_MainWindow):
 
     def resetPreviewTiles(self):
         logging.info("resetPreviewTiles")
+        self.generation += 1
         self.nbTiles =0
         self.tileFov = 0
         self.tbw.setTabEnabled(2, False)
         self.resetImport()
         self.graphics.resetOverviewTiles()
 
+    def startWorker(self, worker, finished, button=None, dropStale=True):
+        """
+        run a VATworker in the thread pool, button is disabled while it runs.
+        With dropStale, the result is dropped if the target or the parameters
+        changed (reset) while the worker was running. The button is then left in
+        the state the reset and the name check give it (buttonAvailable).
+        """
+        generation = self.generation
+        self.workers.add(worker)
+        if button is not None:
+            button.setEnabled(False)
+        def done():
+            self.workers.discard(worker)
+            if button is not None:
+                button.setEnabled(generation == self.generation or self.buttonAvailable(button))
+        def onFinished(result):
+            done()
+            if dropStale and generation != self.generation:
+                logging.info("worker result dropped, parameters changed")
+                self.statusbar.clearMessage()
+                return
+            finished(result)
+        def onError(message):
+            done()
+            if dropStale and generation != self.generation:
+                self.statusbar.clearMessage()
+                return
+            self.statusbar.showMessage("Error: %s"%message)
+        worker.signals.finished.connect(onFinished)
+        worker.signals.error.connect(onError)
+        self.threadPool.start(worker)
+
+    def buttonAvailable(self, button):
+        """
+        state of a button after a reset: the overview needs a checked target,
+        the import needs the tiles and the specs file again
+        """
+        if button is self.pb_generateOverview:
+            return self.targetChecked
+        if button is self.pb_importFits:
+            return False
+        return True
+
     def pb_getData_clicked(self):
         logging.info("pb_getData_clicked")
-        isOk = self.vati.checkObjName(self.le_target.text())
+        self.statusbar.showMessage("Checking %s..."%self.le_target.text())
+        worker = VAT_worker.VATworker(self.vati.checkObjName, self.le_target.text())
+        self.startWorker(worker, self.checkObjNameFinished, self.pb_getData)
+
+    def checkObjNameFinished(self, isOk):
+        self.statusbar.clearMessage()
+        self.targetChecked = isOk
         self.pb_generateOverview.setEnabled(isOk)
 
     def openExistingImageFile(self):
@@ -135,12 +202,20 @@ class VATGui(QMainWindow, Ui_MainWindow):
 
     def pb_generateOverview_clicked(self):
         logging.info("pb_generateOverview_clicked")
+        self.statusbar.showMessage("Downloading overview...")
+        target = self.le_target.text()
+        worker = VAT_worker.VATworker(self.vati.generateOverview,
+                                      target,
+                                      self.dsb_visionField.value(),
+                                      1000)
+        self.startWorker(worker, lambda hdu: self.generateOverviewFinished(hdu, target),
+                         self.pb_generateOverview)
+
+    def generateOverviewFinished(self, hdu, target):
+        self.statusbar.clearMessage()
         previewOK = False
-        hdu = self.vati.generateOverview(self.le_target.text(),
-                                         self.dsb_visionField.value(),
-                                         1000)
         if hdu is not None:
-            self.graphics.plotHDU(hdu, self.le_target.text())
+            self.graphics.plotHDU(hdu, target)
             previewOK = True
         else:
             # if generateOverview is not connected, search a local image
@@ -154,20 +229,38 @@ class VATGui(QMainWindow, Ui_MainWindow):
 
     def pb_calculateTiles_clicked(self):
         logging.info("pb_calculateTiles_clicked")
-        self.nbTiles, self.tileFov, cover = self.vati.calculateNbTiles(self.dsb_visionField.value(),
-                                                                       self.dsb_percentCoverage.value(),
-                                                                       self.dsb_resolution.value(),
-                                                                       self.sb_nbPixels.value())
-        self.tileCoordinatesCenters = self.vati.tilesCoordinates(self.le_target.text(),
-                                                                 self.nbTiles,
-                                                                 self.tileFov,
-                                                                 self.dsb_percentCoverage.value())
-        self.tbw.setTabEnabled(2, True)
+        self.calculateTiles()
+
+    def calculateTiles(self, then=None):
+        """
+        tile centers need the target coordinates (network): computed in a worker, then call then()
+        """
+        nbTiles, tileFov, cover = self.vati.calculateNbTiles(self.dsb_visionField.value(),
+                                                             self.dsb_percentCoverage.value(),
+                                                             self.dsb_resolution.value(),
+                                                             self.sb_nbPixels.value())
+        worker = VAT_worker.VATworker(self.vati.tilesCoordinates,
+                                      self.le_target.text(),
+                                      nbTiles,
+                                      tileFov,
+                                      self.dsb_percentCoverage.value())
+        def finished(tileCoordinatesCenters):
+            self.nbTiles = nbTiles
+            self.tileFov = tileFov
+            self.tileCoordinatesCenters = tileCoordinatesCenters
+            self.tbw.setTabEnabled(2, True)
+            if then is not None:
+                then()
+        self.startWorker(worker, finished, self.pb_calculateTiles)
 
     def pb_previewTiles_clicked(self):
         logging.info("pb_previewTiles_clicked")
         if self.nbTiles == 0:
-            self.pb_calculateTiles.click()
+            self.calculateTiles(self.previewTiles)
+        else:
+            self.previewTiles()
+
+    def previewTiles(self):
         self.graphics.plotOverviewTiles(self.tileCoordinatesCenters,
                                         self.nbTiles,
                                         self.tileFov)
@@ -181,7 +274,42 @@ class VATGui(QMainWindow, Ui_MainWindow):
     def pb_importFits_clicked(self):
         logging.info("pb_importFits_clicked")
         jsonSpecs = self.jsonDump()
-        self.vati.importFits(jsonSpecs, self.tileCoordinatesCenters, self.tileFov)
+        worker = VAT_worker.VATworker(self.vati.importFits, jsonSpecs, self.tileCoordinatesCenters, self.tileFov)
+        worker.kwargs["progress"] = worker.reportProgress
+        worker.kwargs["cancelEvent"] = worker.cancelEvent
+        worker.signals.progress.connect(self.importProgress)
+        worker.signals.error.connect(self.importFitsEnded)
+        self.importWorker = worker
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(True)
+        self.pb_cancelImport.setVisible(True)
+        self.statusbar.showMessage("Importing fits...")
+        self.startWorker(worker, self.importFitsFinished, self.pb_importFits, dropStale=False)
+
+    def importProgress(self, done, total, throughput, eta):
+        self.progressBar.setMaximum(total)
+        self.progressBar.setValue(done)
+        etaText = "--" if eta < 0 else "%d min %02d s"%(eta // 60, eta % 60)
+        self.statusbar.showMessage("Imported tiles: %d/%d  %.2f MB/s  remaining: %s"%(done, total, throughput, etaText))
+
+    def importFitsEnded(self):
+        self.importWorker = None
+        self.progressBar.setVisible(False)
+        self.pb_cancelImport.setVisible(False)
+
+    def importFitsFinished(self, failures):
+        cancelled = self.importWorker.cancelEvent.is_set()
+        self.importFitsEnded()
+        if cancelled:
+            self.statusbar.showMessage("Import cancelled")
+        else:
+            self.statusbar.showMessage("Import finished, %d failed"%len(failures))
+
+    def pb_cancelImport_clicked(self):
+        logging.info("pb_cancelImport_clicked")
+        if self.importWorker is not None:
+            self.importWorker.cancel()
+            self.statusbar.showMessage("Cancelling import...")
 
     def jsonDump(self):
         logging.info("jsonDump")
@@ -195,6 +323,7 @@ class VATGui(QMainWindow, Ui_MainWindow):
         self.target["cb_surveyChannel3"] = self.cb_surveyChannel3.currentText()
         self.target["cb_surveyChannel4"] = self.cb_surveyChannel4.currentText()
         self.target["targetSpecsFile"] = self.targetSpecsFile
+        self.target.setdefault("outputFormat", "fits")
         val = json.dumps(self.target, sort_keys=True, indent=4)
         print(val)
         return val
@@ -245,6 +374,7 @@ class VATGui(QMainWindow, Ui_MainWindow):
             self.cb_surveyChannel3.setCurrentText(val["cb_surveyChannel3"])
             self.cb_surveyChannel4.setCurrentText(val["cb_surveyChannel4"])
             self.targetSpecsFile = val["targetSpecsFile"]
+            self.target["outputFormat"] = val.get("outputFormat", "fits")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,23 @@
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def scaledFits(tmp_path):
+    """
+    écrit une image fits d'entiers bruts avec les mots clés BSCALE/BZERO/BLANK donnés, sans mise à l'échelle
+    """
+    fits = pytest.importorskip("astropy.io.fits")
+
+    def write(raw, fileName="image.fits", **keys):
+        fileName = str(tmp_path / fileName)
+        fits.PrimaryHDU(raw).writeto(fileName, overwrite=True)
+        with fits.open(fileName, mode="update", do_not_scale_image_data=True) as hdul:
+            for k, value in keys.items():
+                hdul[0].header[k] = value
+        return fileName
+    return write
@@ -0,0 +1,67 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import VAT_batching
+
+
+def test_group_tiles_in_neighbour_blocks():
+    work = [(i, ["DSS"]) for i in range(16)]
+    blocks = VAT_batching.groupTiles(work, 4, 2)
+    assert len(blocks) == 4
+    for block in blocks:
+        columns = {i//4 for (i, missing) in block}
+        rows = {i % 4 for (i, missing) in block}
+        assert len(block) == 4 and len(columns) == 2 and len(rows) == 2
+        assert max(columns) - min(columns) == 1 and max(rows) - min(rows) == 1
+    assert sorted(i for block in blocks for (i, missing) in block) == list(range(16))
+    # --- tuiles 0-3 en colonne 0, 4-5 en colonne 1: blocs incomplets en bord de grille
+    assert sorted(sorted(i for (i, missing) in b) for b in VAT_batching.groupTiles(work[:6], 4, 3)) == [[0, 1, 2, 4, 5], [3]]
+
+
+def test_batcher_steps_once_per_observation():
+    batcher = VAT_batching.AdaptiveBatcher()
+    assert batcher.size(10, 300, 4) == 1
+    # --- latence élevée devant le transfert d'une tuile: blocs plus grands, un pas par mesure
+    batcher.observe(1., 0.01, 1)
+    assert batcher.size(10, 300, 4) == 2
+    assert batcher.size(10, 300, 4) == 2
+    for k in range(10):
+        batcher.observe(1., 0.01, 1)
+        batcher.size(10, 300, 4)
+    assert batcher.size(10, 300, 4) == batcher.limit(10, 300, 4) == 5
+    for k in range(3):
+        batcher.observe(0., 0., 1, ok=False)
+    assert batcher.size(10, 300, 4) == 2
+
+
+def test_batcher_disabled():
+    batcher = VAT_batching.AdaptiveBatcher(enabled=False)
+    batcher.observe(1., 0.01, 1)
+    assert batcher.size(10, 300, 4) == 1
+
+
+def test_split_block_geometry(scaledFits):
+    fits = pytest.importorskip("astropy.io.fits")
+    wcs = pytest.importorskip("astropy.wcs")
+    blockWcs = wcs.WCS(naxis=2)
+    blockWcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    blockWcs.wcs.crval = [10.68, 41.27]
+    blockWcs.wcs.crpix = [32.5, 32.5]
+    blockWcs.wcs.cdelt = [-0.001, 0.001]
+    raw = np.arange(64*64, dtype=np.int16).reshape(64, 64)
+    fileName = scaledFits(raw, "block.fits", BZERO=32768., **dict(blockWcs.to_header()))
+    nbPixels = 16
+    positions = [(20, 30), (40, 35)]
+    tiles = [(blockWcs.pixel_to_world(x, y), str(fileName) + "_%d.fits"%k) for k, (x, y) in enumerate(positions)]
+    VAT_batching.splitBlock(fileName, tiles, nbPixels)
+    for ((x, y), (center, tileFile)) in zip(positions, tiles):
+        with fits.open(tileFile, do_not_scale_image_data=True) as hdul:
+            hdu = hdul[0]
+            assert hdu.data.shape == (nbPixels, nbPixels)
+            assert hdu.header["BZERO"] == 32768.
+            tx, ty = wcs.WCS(hdu.header).world_to_pixel(center)
+            # --- centre demandé au milieu de la tuile, à un demi-pixel près pour un côté pair
+            assert abs(tx - (nbPixels - 1)/2.) <= 0.5 + 1.e-6
+            assert abs(ty - (nbPixels - 1)/2.) <= 0.5 + 1.e-6
+            assert hdu.data[int(np.floor(ty + 0.5)), int(np.floor(tx + 0.5))] == raw[y, x]
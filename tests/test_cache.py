@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import VAT_cache
+
+
+def writeFits(tmp_path, size=2880):
+    fileName = str(tmp_path / "tile.fits")
+    with open(fileName, 'wb') as f:
+        f.write(b'\0'*size)
+    return fileName
+
+
+def test_lru_eviction(tmp_path):
+    cache = VAT_cache.CutoutCache(str(tmp_path / "cutouts"), maxBytes=3*2880)
+    tile = writeFits(tmp_path)
+    for key in ("aa1", "bb2", "cc3"):
+        cache.put(key, tile)
+    # --- derniers accès enregistrés sur disque: bb2 est le moins récemment utilisé
+    for key, t in (("aa1", 3000.), ("bb2", 1000.), ("cc3", 2000.)):
+        os.utime(cache.path(key), (t, t))
+    cache.put("dd4", tile)
+    assert sorted(cache.index) == ["aa1", "cc3", "dd4"]
+    assert not os.path.exists(cache.path("bb2"))
+    assert cache.get("bb2") is None
+    assert cache.totalBytes == 3*2880
+
+
+def test_stored_key_never_evicted(tmp_path):
+    cache = VAT_cache.CutoutCache(str(tmp_path / "cutouts"), maxBytes=2880)
+    cache.put("aa1", writeFits(tmp_path, 2*2880))
+    assert cache.get("aa1") == cache.path("aa1")
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = VAT_cache.CutoutCache(str(tmp_path / "cutouts"))
+    cache.put("aa1", writeFits(tmp_path))
+    os.unlink(cache.path("aa1"))
+    assert cache.get("aa1") is None
+    assert "aa1" not in cache.index
+    assert cache.totalBytes == 0
+
+
+def test_file_of_another_process_found(tmp_path):
+    directory = str(tmp_path / "cutouts")
+    other = VAT_cache.CutoutCache(directory)
+    cache = VAT_cache.CutoutCache(directory)
+    other.put("aa1", writeFits(tmp_path))
+    assert cache.get("aa1") == cache.path("aa1")
+    assert cache.totalBytes == 2880
+
+
+def test_ttl(tmp_path):
+    cache = VAT_cache.CutoutCache(str(tmp_path / "cutouts"), ttl=60.)
+    cache.put("aa1", writeFits(tmp_path))
+    cache.index["aa1"][2] -= 120.
+    assert cache.get("aa1") is None
+
+
+def test_key_normalized():
+    coordinates = pytest.importorskip("astropy.coordinates")
+    u = pytest.importorskip("astropy.units")
+    center = coordinates.SkyCoord(10.684708, 41.26875, unit="deg")
+    near = coordinates.SkyCoord(10.684708 + 1.e-9, 41.26875, unit="deg")
+    key = VAT_cache.CutoutCache.key("DSS", center, 0.25*u.deg, 300)
+    assert VAT_cache.CutoutCache.key("DSS", near, 15.*u.arcmin, 300) == key
+    assert VAT_cache.CutoutCache.key("DSS2 Red", center, 0.25*u.deg, 300) != key
+    assert VAT_cache.CutoutCache.key("DSS", center, 0.25*u.deg, 301) != key
+    assert VAT_cache.CutoutCache.key("DSS", "m 31", 0.25, 300) == VAT_cache.CutoutCache.key("DSS", "M31", 0.25*u.deg, 300)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("requests")
+
+import VAT_download
+
+
+def test_run_queue_refills_without_waiting_for_slow_tasks():
+    scheduler = VAT_download.DownloadScheduler(maxWorkers=2)
+    release = threading.Event()
+    finished = []
+    def task(k):
+        if k == 0:
+            release.wait(5.)
+        finished.append(k)
+        return k*k
+    remaining = iter(range(6))
+    def nextTask():
+        k = next(remaining, None)
+        return None if k is None else (task, (k,))
+    def callback(k, result):
+        # --- la tâche lente n'est libérée qu'après toutes les autres
+        if len(finished) == 5:
+            release.set()
+    results = scheduler.runQueue(nextTask, callback)
+    scheduler.shutdown()
+    assert results == [k*k for k in range(6)]
+    assert finished[-1] == 0
+
+
+def test_run_queue_bounded_and_cancelled():
+    scheduler = VAT_download.DownloadScheduler(maxWorkers=2)
+    cancelEvent = threading.Event()
+    running = {"now": 0, "max": 0}
+    lock = threading.Lock()
+    def task(k):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        time.sleep(0.05)
+        with lock:
+            running["now"] -= 1
+        if k == 3:
+            cancelEvent.set()
+        return k
+    remaining = iter(range(100))
+    results = scheduler.runQueue(lambda: (task, (next(remaining),)), cancelEvent=cancelEvent, maxPending=2)
+    scheduler.shutdown()
+    assert running["max"] <= 2
+    assert 4 <= len(results) < 10
+    assert results[:4] == [0, 1, 2, 3]
+
+
+def test_run_keeps_task_order():
+    scheduler = VAT_download.DownloadScheduler(maxWorkers=3)
+    done = []
+    results = scheduler.run([(time.sleep, (0.01*(5 - k),)) for k in range(5)], lambda k, result: done.append(k))
+    scheduler.shutdown()
+    assert results == [None]*5
+    assert sorted(done) == list(range(5))
+
@@ -0,0 +1,36 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+fits = pytest.importorskip("astropy.io.fits")
+
+import VAT_fits
+
+
+def test_read_rows_scaling_and_blank(scaledFits):
+    raw = np.arange(-50, 50, dtype=np.int16).reshape(10, 10)
+    raw[4, 2] = -32768
+    fileName = scaledFits(raw, BSCALE=0.5, BZERO=1000., BLANK=-32768)
+    with fits.open(fileName, memmap=True, do_not_scale_image_data=True) as hdul:
+        rows = VAT_fits.readRows(VAT_fits.imageHDU(hdul), 3, 6)
+    expected = raw[3:6]*0.5 + 1000.
+    expected[1, 2] = np.nan
+    assert rows.dtype == np.float64
+    np.testing.assert_array_equal(rows, expected)
+
+
+def test_read_rows_without_scaling(scaledFits):
+    raw = np.arange(20, dtype=np.int16).reshape(4, 5)
+    fileName = scaledFits(raw)
+    with fits.open(fileName, do_not_scale_image_data=True) as hdul:
+        np.testing.assert_array_equal(VAT_fits.readRows(VAT_fits.imageHDU(hdul), 0, 4), raw)
+
+
+def test_read_rows_of_compressed_tile(scaledFits):
+    raw = np.arange(-200, 200, dtype=np.int16).reshape(20, 20)
+    fileName = scaledFits(raw, BSCALE=2., BZERO=-5.)
+    VAT_fits.compressFits(fileName, "rice")
+    with fits.open(fileName, do_not_scale_image_data=True) as hdul:
+        hdu = VAT_fits.imageHDU(hdul)
+        assert isinstance(hdu, fits.CompImageHDU)
+        # --- compression sans perte des entiers
+        np.testing.assert_array_equal(VAT_fits.readRows(hdu, 7, 12), raw[7:12]*2. - 5.)
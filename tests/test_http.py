@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("requests")
+
+import VAT_http
+
+
+def test_adapter_pool_size_and_session_timeout(monkeypatch):
+    # --- adaptateur propre au test: l'adaptateur du processus garde sa taille
+    monkeypatch.setattr(VAT_http, "_adapter", None)
+    pooled = VAT_http.adapter(4)
+    assert pooled.poolSize == 4
+    assert VAT_http.adapter(2) is pooled and pooled.poolSize == 2
+    assert VAT_http.adapter().poolSize == 2
+    session = VAT_http.session(timeout=7.)
+    adapter = session.get_adapter("https://skyview.gsfc.nasa.gov")
+    assert isinstance(adapter, VAT_http.TimeoutAdapter)
+    assert adapter.pooled is pooled and adapter.timeout == (VAT_http.CONNECT_TIMEOUT, 7.)
+    assert VAT_http.session().get_adapter("https://skyview.gsfc.nasa.gov") is pooled
+    # --- le délai de la session remplace celui de l'appel, sans changer l'adaptateur partagé
+    sent = {}
+    class Pooled:
+        def send(self, request, timeout=None, **kwargs):
+            sent["timeout"] = timeout
+    VAT_http.TimeoutAdapter(Pooled(), (1., 2.)).send(None, timeout=60.)
+    assert sent["timeout"] == (1., 2.)
+    assert pooled.timeout == (VAT_http.CONNECT_TIMEOUT, VAT_http.READ_TIMEOUT)
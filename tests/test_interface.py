@@ -0,0 +1,78 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("astroquery")
+
+import VAT_cache
+import VAT_interface
+import VAT_manifest
+import VAT_standin
+
+
+class ExpiringStandin(VAT_standin.StandinServer):
+    """
+    serveur dont les liens fits portent le numéro de leur page de résultats:
+    les liens des pages de expired n'existent plus, comme ceux purgés de /tempspace de SkyView
+    """
+
+    def __init__(self, expired):
+        super().__init__()
+        self.expired = set(expired)
+        self.pages = 0
+
+    def results(self, params):
+        with self.lock:
+            page = self.pages
+            self.pages += 1
+        return super().results(params).replace('">FITS</a>', '&page=%d">FITS</a>'%page)
+
+    def image(self, params):
+        if int(params["page"][0]) in self.expired:
+            raise IOError("expired")
+        return super().image(params)
+
+
+def importTarget(tmp_path, server, maxAttempts=3):
+    specsFile = str(tmp_path / "M31.json")
+    specs = {"le_target": "M31", "dsb_visionField": 0.07, "sb_nbPixels": 50, "dsb_resolution": 3.,
+             "dsb_percentCoverage": 10., "cb_surveyChannel1": "DSS", "cb_surveyChannel2": "none",
+             "cb_surveyChannel3": "none", "cb_surveyChannel4": "none", "targetSpecsFile": specsFile}
+    vati = VAT_interface.VAT_interface(maxWorkers=1, maxAttempts=maxAttempts, baseUrl=server.url, batching=False,
+                                       cache=VAT_cache.CutoutCache(str(tmp_path / "cutouts")))
+    vati.scheduler.baseDelay = 0.01
+    # --- cache d'astroquery propre au test: un autre test sur le même port ne doit pas y avoir laissé de page
+    vati.skyviewService().cache_location = str(tmp_path / "astroquery")
+    nbTiles, tileFov, cover = vati.calculateNbTiles(specs["dsb_visionField"], specs["dsb_percentCoverage"],
+                                                    specs["dsb_resolution"], specs["sb_nbPixels"])
+    centers = vati.tilesCoordinates("M31", nbTiles, tileFov, specs["dsb_percentCoverage"])
+    try:
+        failures = vati.importFits(json.dumps(specs), centers, tileFov)
+    finally:
+        vati.scheduler.shutdown()
+    return failures, specsFile, len(centers)
+
+
+def test_retry_requeries_skyview(tmp_path, monkeypatch):
+    monkeypatch.setenv("VAT_CACHE_DIR", str(tmp_path / "cache"))
+    with ExpiringStandin(expired=[0]) as server:
+        failures, specsFile, nbTiles = importTarget(tmp_path, server)
+    assert failures == []
+    # --- une page par tuile, plus une nouvelle page pour la tentative qui a suivi le lien mort
+    assert server.pages == nbTiles + 1
+    manifest = VAT_manifest.JobManifest(specsFile)
+    assert len(manifest.keys(VAT_manifest.DONE)) == nbTiles
+
+
+def test_resume_requeries_skyview(tmp_path, monkeypatch):
+    monkeypatch.setenv("VAT_CACHE_DIR", str(tmp_path / "cache"))
+    with ExpiringStandin(expired=range(100)) as server:
+        failures, specsFile, nbTiles = importTarget(tmp_path, server, maxAttempts=1)
+        assert len(failures) == nbTiles
+        # --- reprise après la purge des liens: les pages de la première exécution ne doivent pas être relues
+        server.expired = set(range(server.pages))
+        failures, specsFile, nbTiles = importTarget(tmp_path, server, maxAttempts=1)
+    assert failures == []
+    assert server.pages == 2*nbTiles
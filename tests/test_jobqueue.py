@@ -0,0 +1,37 @@
+import os
+
+import VAT_jobqueue
+import VAT_manifest
+
+
+def test_priority_then_oldest_first(tmp_path):
+    queue = VAT_jobqueue.JobQueue(str(tmp_path / "queue.json"))
+    for (name, priority) in (("a.json", 0), ("b.json", 5), ("c.json", 5), ("d.json", 1)):
+        queue.add(str(tmp_path / name), priority)
+    order = [os.path.basename(queue.next()) for k in range(4)]
+    assert order == ["b.json", "c.json", "d.json", "a.json"]
+    assert queue.next() is None
+
+
+def test_interrupted_job_resumed(tmp_path):
+    queueFile = str(tmp_path / "queue.json")
+    queue = VAT_jobqueue.JobQueue(queueFile)
+    queue.add(str(tmp_path / "a.json"))
+    specsFile = queue.next()
+    reloaded = VAT_jobqueue.JobQueue(queueFile)
+    assert reloaded.counts() == {VAT_manifest.PENDING: 1}
+    assert reloaded.next() == specsFile
+
+
+def test_finish_and_readd(tmp_path):
+    queue = VAT_jobqueue.JobQueue(str(tmp_path / "queue.json"))
+    queue.add(str(tmp_path / "a.json"))
+    queue.add(str(tmp_path / "b.json"))
+    queue.finish(queue.next(), "unknown object")
+    queue.finish(queue.next())
+    assert queue.counts() == {VAT_manifest.FAILED: 1, VAT_manifest.DONE: 1}
+    # --- remise en attente: l'erreur est oubliée
+    queue.add(str(tmp_path / "a.json"), 3)
+    job = queue.find(str(tmp_path / "a.json"))
+    assert job["state"] == VAT_manifest.PENDING and "error" not in job
+    assert queue.next() == str(tmp_path / "a.json")
@@ -0,0 +1,67 @@
+import os
+import json
+
+import VAT_manifest
+
+
+def writeTile(tmp_path, name, size=2880):
+    fileName = str(tmp_path / name)
+    with open(fileName, 'wb') as f:
+        f.write(b'\0'*size)
+    return fileName
+
+
+def test_journal_replayed_then_compacted(tmp_path):
+    specsFile = str(tmp_path / "M31.json")
+    manifest = VAT_manifest.JobManifest(specsFile)
+    manifest.addPending(["DSS_tile_0", "DSS_tile_1"])
+    fileImage = writeTile(tmp_path, "M31_DSS_tile_0.fits")
+    manifest.markDone("DSS_tile_0", fileImage)
+    manifest.setState("DSS_tile_1", VAT_manifest.FAILED, error="timeout")
+    # --- les changements ne sont que dans le journal
+    assert not os.path.isfile(manifest.fileName)
+    assert os.path.isfile(manifest.journalName)
+
+    reloaded = VAT_manifest.JobManifest(specsFile)
+    assert reloaded.isDone("DSS_tile_0", fileImage)
+    assert reloaded.state("DSS_tile_1") == VAT_manifest.FAILED
+    assert reloaded.entries["DSS_tile_1"]["error"] == "timeout"
+    # --- le journal rejoué est fusionné dans le manifeste puis supprimé
+    assert os.path.isfile(reloaded.fileName)
+    assert not os.path.isfile(reloaded.journalName)
+    with open(reloaded.fileName, encoding="utf-8") as f:
+        assert json.load(f) == reloaded.entries
+
+
+def test_incomplete_last_journal_line_ignored(tmp_path):
+    specsFile = str(tmp_path / "M31.json")
+    manifest = VAT_manifest.JobManifest(specsFile)
+    manifest.setState("DSS_tile_0", VAT_manifest.FAILED, error="timeout")
+    manifest.journal.write('{"keys": ["DSS_tile_0"], "sta')
+    manifest.journal.flush()
+    reloaded = VAT_manifest.JobManifest(specsFile)
+    assert reloaded.state("DSS_tile_0") == VAT_manifest.FAILED
+
+
+def test_inflight_recovered_as_pending(tmp_path):
+    specsFile = str(tmp_path / "M31.json")
+    manifest = VAT_manifest.JobManifest(specsFile)
+    manifest.addPending(["DSS_tile_0"])
+    manifest.setState("DSS_tile_0", VAT_manifest.INFLIGHT, attempts=1)
+    # --- interruption pendant la requête, après l'écriture d'un manifeste complet
+    manifest.compact()
+    reloaded = VAT_manifest.JobManifest(specsFile)
+    assert reloaded.state("DSS_tile_0") == VAT_manifest.PENDING
+    assert reloaded.keys(VAT_manifest.INFLIGHT) == []
+
+
+def test_done_requires_file_of_recorded_size(tmp_path):
+    manifest = VAT_manifest.JobManifest(str(tmp_path / "M31.json"))
+    fileImage = writeTile(tmp_path, "M31_DSS_tile_0.fits")
+    manifest.setState("DSS_tile_0", VAT_manifest.FAILED, error="timeout")
+    manifest.markDone("DSS_tile_0", fileImage)
+    assert "error" not in manifest.entries["DSS_tile_0"]
+    assert manifest.isDone("DSS_tile_0", fileImage)
+    writeTile(tmp_path, "M31_DSS_tile_0.fits", 1000)
+    assert not manifest.isDone("DSS_tile_0", fileImage)
+    assert manifest.state("DSS_tile_9") == VAT_manifest.PENDING
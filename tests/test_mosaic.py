@@ -0,0 +1,57 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+fits = pytest.importorskip("astropy.io.fits")
+WCS = pytest.importorskip("astropy.wcs").WCS
+
+import VAT_mosaic
+
+SIZE = 21
+STEP = 16
+SCALE = 1.e-3
+CENTER = (10., 20.)
+
+
+def tileKeys(i, j):
+    """
+    tuile (i, j) d'une grille 2x2 sur une même projection TAN, centre de la tuile à (±8, ±8) pixels de CENTER
+    """
+    return dict(CTYPE1="RA---TAN", CTYPE2="DEC--TAN", CRVAL1=CENTER[0], CRVAL2=CENTER[1],
+                CDELT1=-SCALE, CDELT2=SCALE,
+                CRPIX1=(SIZE + 1)/2. - (j - 0.5)*STEP, CRPIX2=(SIZE + 1)/2. - (i - 0.5)*STEP,
+                BSCALE=0.5, BZERO=100.)
+
+
+@pytest.fixture
+def tiles(scaledFits):
+    """
+    4 tuiles constantes, de valeurs physiques 100 + 0.5*raw
+    """
+    files = []
+    for i in range(2):
+        for j in range(2):
+            raw = np.full((SIZE, SIZE), 10*(2*i + j + 1), dtype=np.int16)
+            files.append(scaledFits(raw, "tile_%d.fits"%(2*i + j), **tileKeys(i, j)))
+    return files
+
+
+def test_processes_identical_and_feathered(tmp_path, tiles):
+    cover = 100.*(SIZE - STEP)/SIZE
+    outputs = []
+    for processes in (1, 2):
+        outputFile = str(tmp_path / ("mosaic_%d.fits"%processes))
+        VAT_mosaic.buildMosaic(tiles, outputFile, cover, maxStripBytes=1024, processes=processes)
+        with fits.open(outputFile) as hdul:
+            outputs.append((hdul[0].header.copy(), hdul[0].data.copy()))
+    (header, data), (_, data2) = outputs
+    np.testing.assert_array_equal(data, data2)
+    # --- pixel de la sortie sur CENTER: tuiles aux pixels (2, 2), (18, 2)... même poids de la rampe
+    x, y = (int(np.round(v)) for v in WCS(header).world_to_pixel_values(*CENTER))
+    values = 100. + 0.5*np.array([10., 20., 30., 40.])
+    np.testing.assert_allclose(data[y, x], values.mean(), rtol=1.e-6)
+    # --- recouvrement des deux tuiles du haut seulement
+    np.testing.assert_allclose(data[y + 12, x], values[2:].mean(), rtol=1.e-6)
+    # --- un pixel plus loin: x = 19 dans la tuile de gauche (rampe 1.5/5), x = 3 dans celle de droite (3.5/5)
+    np.testing.assert_allclose(data[y + 12, x + 1], (1.5*values[2] + 3.5*values[3])/5., rtol=1.e-6)
+    # --- hors recouvrement: la tuile (0, 0) seule
+    np.testing.assert_allclose(data[y - 12, x - 12], values[0], rtol=1.e-6)
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+fits = pytest.importorskip("astropy.io.fits")
+
+import VAT_fits
+import VAT_pyramid
+
+
+@pytest.mark.parametrize("outputFormat", ["fits", "rice"])
+@pytest.mark.parametrize("binning", [True, False])
+def test_levels_by_row_strips(tmp_path, scaledFits, outputFormat, binning):
+    raw = np.arange(-2000, 2000, dtype=np.int16).reshape(50, 80)
+    fileName = scaledFits(raw, BSCALE=2., BZERO=10.)
+    VAT_fits.compressFits(fileName, outputFormat)
+    cache = VAT_pyramid.PyramidCache(str(tmp_path / "pyramids"))
+    header, pyramid = VAT_pyramid.pyramidForFile(fileName, binning, cache)
+    try:
+        if outputFormat == "rice":
+            assert isinstance(pyramid.data, VAT_pyramid.SectionData)
+        assert pyramid.shape == raw.shape
+        if binning:
+            expected = raw[:50, :80].astype(np.float32).reshape(25, 2, 40, 2).mean(axis=(1, 3))
+        else:
+            expected = raw[::2, ::2]
+        np.testing.assert_allclose(pyramid.level(1), expected)
+        block, extent = pyramid.read(0, 10., 20., 5., 8.)
+        np.testing.assert_array_equal(block, raw[5:10, 10:22]*2. + 10.)
+    finally:
+        pyramid.close()
+
+
+def test_section_data_slices(scaledFits):
+    raw = np.arange(30*20, dtype=np.int16).reshape(30, 20)
+    fileName = scaledFits(raw)
+    VAT_fits.compressFits(fileName, "rice")
+    with fits.open(fileName, do_not_scale_image_data=True) as hdul:
+        data = VAT_pyramid.SectionData(VAT_fits.imageHDU(hdul))
+        assert data.shape == (30, 20) and data.itemsize == 2
+        np.testing.assert_array_equal(data[3:25:4, ::3], raw[3:25:4, ::3])
+        np.testing.assert_array_equal(data[28:40], raw[28:40])
+        assert data[40:50].shape == (0, 20)
+
+
+@pytest.mark.parametrize("outputFormat", ["fits", "rice"])
+@pytest.mark.parametrize("binning", [True, False])
+def test_blank_pixels_masked(tmp_path, scaledFits, outputFormat, binning):
+    raw = np.full((32, 32), 100, dtype=np.int16)
+    raw[0:2, 0:2] = -32768
+    raw[0, 2] = -32768
+    fileName = scaledFits(raw, BSCALE=2., BZERO=10., BLANK=-32768)
+    VAT_fits.compressFits(fileName, outputFormat)
+    cache = VAT_pyramid.PyramidCache(str(tmp_path / "pyramids"))
+    header, pyramid = VAT_pyramid.pyramidForFile(fileName, binning, cache)
+    try:
+        level = pyramid.physical(pyramid.level(1), 1)
+        # --- bloc entièrement blank: NaN; bloc en partie blank: moyenne des autres pixels seulement
+        assert np.isnan(level[0, 0])
+        if binning:
+            assert level[0, 1] == 210.
+        assert np.nanmin(level) == np.nanmax(level) == 210.
+        block, extent = pyramid.read(0, 0., 3., 0., 1.)
+        assert np.isnan(block[0, :3]).all() and block[0, 3] == 210.
+    finally:
+        pyramid.close()
@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("numpy")
+coordinates = pytest.importorskip("astropy.coordinates")
+
+import VAT_resolver
+import VAT_standin
+
+
+def resolver(tmp_path, server, **kwargs):
+    return VAT_resolver.NameResolver(str(tmp_path / "names.json"), useSimbad=False,
+                                     sesameUrl=server.url + VAT_standin.SESAME_PATH, baseDelay=0., **kwargs)
+
+
+def test_known_and_unknown_objects(tmp_path):
+    with VAT_standin.StandinServer() as server:
+        names = resolver(tmp_path, server)
+        metadata = names.query("M31")
+        assert (metadata["ra"], metadata["dec"]) == pytest.approx(VAT_standin.OBJECTS["M31"])
+        assert names.query("Andromeda") is None
+        assert names.coordinates("m 31").ra.degree == pytest.approx(VAT_standin.OBJECTS["M31"][0])
+        requests = server.counts["requests"]
+    # --- noms résolus gardés dans le cache, disponibles hors ligne
+    offline = VAT_resolver.NameResolver(str(tmp_path / "names.json"), offline=True, useSimbad=False)
+    assert offline.query("M31") == metadata
+    assert requests == 2
+
+
+def test_outage_is_not_an_unknown_object(tmp_path):
+    with VAT_standin.StandinServer(errorRate=1.) as server:
+        names = resolver(tmp_path, server, maxAttempts=2)
+        with pytest.raises(coordinates.name_resolve.NameResolveError):
+            names.query("M32")
+        assert server.counts["requests"] == 2
+    assert names.entries == {}
+    with VAT_standin.StandinServer() as server:
+        names = resolver(tmp_path, server)
+        assert names.query("M32") is not None
@@ -0,0 +1,20 @@
+import os
+import importlib.util
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("requests")
+
+spec = importlib.util.spec_from_file_location(
+    "bench_startup", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "bench_startup.py"))
+bench_startup = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_startup)
+
+
+def test_no_heavy_module_at_startup(tmp_path, monkeypatch):
+    # --- caches du processus fils dans un répertoire temporaire
+    monkeypatch.setenv("VAT_CACHE_DIR", str(tmp_path))
+    times = bench_startup.importTimes(bench_startup.STARTUP)
+    assert "VAT_batch" in times
+    assert sorted(name for name in times if name.startswith(bench_startup.HEAVY)) == []
@@ -0,0 +1,70 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import VAT_stats
+
+
+def test_running_stats_merge():
+    rng = np.random.default_rng(0)
+    data = rng.normal(10., 3., (100, 37))
+    data[rng.random(data.shape) < 0.1] = np.nan
+    stats = VAT_stats.RunningStats()
+    for chunk in VAT_stats.chunks(data, maxElements=200):
+        stats.add(chunk)
+    finite = data[np.isfinite(data)]
+    assert stats.n == finite.size
+    assert stats.nanCount == data.size - finite.size
+    assert stats.mean == pytest.approx(finite.mean())
+    assert stats.std == pytest.approx(finite.std())
+    assert (stats.min, stats.max) == (finite.min(), finite.max())
+
+
+def test_running_stats_clipped():
+    data = np.arange(100.).reshape(10, 10)
+    stats = VAT_stats.RunningStats()
+    for chunk in VAT_stats.chunks(data, maxElements=30):
+        stats.add(chunk, 20., 59.)
+    assert stats.n == 40
+    assert stats.mean == pytest.approx(39.5)
+    assert stats.std == pytest.approx(np.arange(20., 60.).std())
+
+
+def test_image_stats():
+    rng = np.random.default_rng(1)
+    data = rng.normal(100., 5., (64, 64))
+    data[0, :8] = 1.e6
+    data[1, :] = np.nan
+    stats = VAT_stats.imageStats(data, 3.)
+    assert stats["pixels"] == data.size
+    assert stats["nanFraction"] == pytest.approx(1./64)
+    assert stats["max"] == 1.e6
+    # --- les pixels aberrants sont exclus du fond
+    assert stats["background"] == pytest.approx(100., abs=0.5)
+    assert stats["backgroundStd"] == pytest.approx(5., rel=0.1)
+    assert stats["snr"] == pytest.approx(stats["mean"]/stats["std"])
+
+
+def test_constant_and_empty_images():
+    assert np.isnan(VAT_stats.imageStats(np.ones((8, 8)))["snr"])
+    stats = VAT_stats.imageStats(np.full((8, 8), np.nan))
+    assert stats["nanFraction"] == 1.
+    assert np.isnan(stats["mean"])
+
+
+@pytest.mark.parametrize("outputFormat", ["fits", "rice"])
+def test_file_stats_by_rows(scaledFits, outputFormat):
+    VAT_fits = pytest.importorskip("VAT_fits")
+    rng = np.random.default_rng(2)
+    raw = rng.integers(-1000, 1000, (50, 40)).astype(np.int16)
+    raw[3, 5] = -32768
+    fileName = scaledFits(raw, BSCALE=2., BZERO=100., BLANK=-32768)
+    VAT_fits.compressFits(fileName, outputFormat)
+    physical = raw*2. + 100.
+    physical[3, 5] = np.nan
+    stats = VAT_stats.fileStats(fileName)
+    expected = VAT_stats.imageStats(physical, 3.)
+    for k in ("pixels", "nanFraction", "min", "max"):
+        assert stats[k] == expected[k]
+    for k in ("mean", "std", "background", "backgroundStd"):
+        assert stats[k] == pytest.approx(expected[k])
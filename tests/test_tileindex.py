@@ -0,0 +1,60 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import VAT_tileindex
+
+
+def vector(ra, dec):
+    return VAT_tileindex.unitVectors(ra, dec)
+
+
+def test_contains():
+    requested = vector(10., 41.)
+    assert VAT_tileindex.contains(requested, requested, 0.1, 1.e-9)
+    # --- décalée de 0.005° en déclinaison: contenue avec une marge de 0.01°, pas de 0.001°
+    shifted = vector(10., 41.005)
+    assert VAT_tileindex.contains(shifted, requested, 0.1, 0.01)
+    assert not VAT_tileindex.contains(shifted, requested, 0.1, 0.001)
+    assert not VAT_tileindex.contains(vector(190., -41.), requested, 0.1, 1.)
+
+
+def test_nearest(tmp_path):
+    index = VAT_tileindex.TileIndex(str(tmp_path / "tiles.json"))
+    index.add("DSS", 0.1, 300, 10.005, 41., "near", "planA")
+    index.add("DSS", 0.1, 300, 10., 41.008, "farther", "planB")
+    index.add("DSS", 0.1, 300, 10.1, 41., "outside", "planB")
+    index.add("DSS2 Red", 0.1, 300, 10., 41., "otherSurvey", "planB")
+    key, distance = index.nearest("DSS", 0.1, 300, 10., 41.)
+    assert key == "near"
+    assert distance == pytest.approx(0.005*np.cos(np.radians(41.)), rel=1.e-3)
+    # --- les tuiles du plan en cours ne sont pas réutilisées
+    assert index.nearest("DSS", 0.1, 300, 10., 41., origin="planA")[0] == "farther"
+    assert index.nearest("DSS", 0.1, 300, 10., 41., maxDistance=0.001) == (None, None)
+    assert index.nearest("DSS", 0.1, 300, 10.1, 41.2) == (None, None)
+    assert index.nearest("DSS", 0.1, 500, 10., 41.) == (None, None)
+    index.remove("DSS", 0.1, 300, "near")
+    assert index.nearest("DSS", 0.1, 300, 10., 41.)[0] == "farther"
+
+
+def test_max_distance():
+    index = VAT_tileindex.TileIndex("unused.json", tolerance=0.05)
+    assert index.maxDistance(0.1) == pytest.approx(0.01)
+    assert index.maxDistance(0.1, spacing=0.02) == pytest.approx(0.005)
+
+
+def test_save_merges_processes(tmp_path):
+    fileName = str(tmp_path / "tiles.json")
+    first = VAT_tileindex.TileIndex(fileName)
+    second = VAT_tileindex.TileIndex(fileName)
+    first.add("DSS", 0.1, 300, 10., 41., "a", "planA")
+    first.add("DSS", 0.1, 300, 20., 41., "b", "planA")
+    second.add("DSS", 0.1, 300, 30., 41., "c", "planB")
+    first.save()
+    second.save()
+    # --- les tuiles du premier processus sont gardées et visibles dans le second
+    assert second.nearest("DSS", 0.1, 300, 10., 41.)[0] == "a"
+    first.remove("DSS", 0.1, 300, "b")
+    first.save()
+    reloaded = VAT_tileindex.TileIndex(fileName)
+    assert sorted(reloaded.groups[VAT_tileindex.TileIndex.group("DSS", 0.1, 300)]) == ["a", "c"]